@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db import transaction
+from . import aggregates
 from .models import Movie, Rating
 
 # Register your models here.
@@ -13,6 +15,19 @@ class RatingAdmin(admin.ModelAdmin):
     list_display = ('movie', 'user', 'stars',)
     search_fields = ('movie', 'user', 'stars',)
 
+    def save_model(self, request, obj, form, change):
+        # move the vote in the movie aggregates, as the API does
+        with transaction.atomic():
+            old = None
+            if change:
+                old = (Rating.objects.select_for_update().filter(pk=obj.pk)
+                       .values_list('movie_id', 'stars').first())
+            super().save_model(request, obj, form, change)
+            votes = [(obj.movie_id, None, obj.stars)]
+            if old is not None:
+                votes.append((old[0], old[1], None))
+            aggregates.apply_votes(votes)
+
 
 admin.site.register(Movie, MovieAdmin)
 admin.site.register(Rating, RatingAdmin)
@@ -0,0 +1,153 @@
+"""
+Denormalized rating aggregates stored on the Movie row.
+
+Every write that adds, changes or removes a Rating goes through the helpers
+in this module so that Movie.rating_count, Movie.rating_sum and the per-star
+histogram columns (Movie.stars_1 to Movie.stars_5) stay in step with the
+Rating table. The same statements refresh Movie.bayes_score, the damped
+average the leaderboard is ranked by. The updates are single UPDATE statements built from
+F() expressions, so concurrent votes never lose an increment.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import (Case, Count, F, FloatField, OuterRef, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+
+from . import cache
+from .models import Movie, Rating
+
+STAR_FIELDS = {stars: f'stars_{stars}' for stars in range(1, 6)}
+
+# movies per UPDATE when applying a batch of votes
+BATCH_SIZE = 1000
+
+
+def vote_delta(old_stars=None, new_stars=None):
+    """
+    Return the change a single vote makes to a movie's aggregates.
+
+    old_stars is None for a brand new rating and new_stars is None for a
+    deleted one. The result maps Movie field names to integer increments.
+    """
+    delta = dict.fromkeys(['rating_count', 'rating_sum', *STAR_FIELDS.values()], 0)
+    if old_stars is not None:
+        delta['rating_count'] -= 1
+        delta['rating_sum'] -= old_stars
+        delta[STAR_FIELDS[old_stars]] -= 1
+    if new_stars is not None:
+        delta['rating_count'] += 1
+        delta['rating_sum'] += new_stars
+        delta[STAR_FIELDS[new_stars]] += 1
+    return delta
+
+
+def bayes_score(count, total):
+    """
+    Damped average as an SQL expression over a rating count and sum.
+
+    Each movie starts with RATING_PRIOR_WEIGHT phantom votes of
+    RATING_PRIOR_MEAN stars, so one 5-star vote cannot outrank thousands of
+    4.8s. Unrated movies score 0.
+    """
+    weight = float(settings.RATING_PRIOR_WEIGHT)
+    prior = weight * settings.RATING_PRIOR_MEAN
+    return Case(
+        When(GreaterThan(count, 0),
+             then=(Value(prior) + total) / (Value(weight) + count)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _changes(delta):
+    changes = {field: F(field) + value for field, value in delta.items() if value}
+    if changes:
+        # every SET expression reads the old row, so rebuild the new count
+        # and sum from the old values plus this delta
+        changes['bayes_score'] = bayes_score(
+            F('rating_count') + delta.get('rating_count', 0),
+            F('rating_sum') + delta.get('rating_sum', 0))
+    return changes
+
+
+def apply_vote(movie_id, old_stars=None, new_stars=None):
+    """Apply one vote to the stored aggregates of a movie."""
+    changes = _changes(vote_delta(old_stars, new_stars))
+    if changes:
+        Movie.objects.filter(id=movie_id).update(**changes)
+        cache.bump([movie_id])
+
+
+def apply_votes(votes):
+    """
+    Apply many (movie_id, old_stars, new_stars) votes at once.
+
+    Movies whose aggregates move by the same amount share one UPDATE, so a
+    batch costs a few dozen statements at most however many movies it
+    touches.
+    """
+    totals = defaultdict(lambda: defaultdict(int))
+    for movie_id, old_stars, new_stars in votes:
+        for field, value in vote_delta(old_stars, new_stars).items():
+            totals[movie_id][field] += value
+
+    groups = defaultdict(list)
+    for movie_id, delta in totals.items():
+        groups[tuple(sorted(delta.items()))].append(movie_id)
+
+    for delta, movie_ids in groups.items():
+        changes = _changes(dict(delta))
+        if not changes:
+            continue
+        for start in range(0, len(movie_ids), BATCH_SIZE):
+            batch = movie_ids[start:start + BATCH_SIZE]
+            Movie.objects.filter(id__in=batch).update(**changes)
+    if totals:
+        cache.bump(totals)
+
+
+def rebuild(movie_ids=None):
+    """
+    Recompute the stored aggregates from the Rating table.
+
+    Used after bulk loads and to repair drift; pass movie_ids to limit the
+    rebuild to some movies, otherwise the whole catalogue is refreshed.
+    """
+    ratings = (Rating.objects.filter(movie=OuterRef('pk'))
+               .order_by().values('movie'))
+
+    def aggregate(expression):
+        column = ratings.annotate(value=expression).values('value')
+        return Coalesce(Subquery(column), Value(0))
+
+    changes = {
+        'rating_count': aggregate(Count('id')),
+        'rating_sum': aggregate(Sum('stars')),
+    }
+    for stars, field in STAR_FIELDS.items():
+        changes[field] = aggregate(Count('id', filter=Q(stars=stars)))
+
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(id__in=movie_ids)
+    updated = movies.update(**changes)
+    rescore(movie_ids)
+    return updated
+
+
+def rescore(movie_ids=None):
+    """
+    Recompute bayes_score from the stored aggregates.
+
+    rebuild() calls this; run it on its own after changing the prior.
+    """
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(id__in=movie_ids)
+    updated = movies.update(
+        bayes_score=bayes_score(F('rating_count'), F('rating_sum')))
+    cache.bump(movie_ids)
+    return updated
@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    from . import search
+    search.install(using)
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # connect signal handlers
+        from . import signals  # noqa: F401
+        # (re)create the full-text index after every migrate
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,162 @@
+"""
+Async read-only endpoints for the movie and rating lists.
+
+- /api/async/movies/         like GET /api/movies/
+- /api/async/movies/{id}/    like GET /api/movies/{id}/
+- /api/async/ratings/        like GET /api/ratings/
+
+Django's async ORM would run every query through
+sync_to_async(thread_sensitive=True), on the one thread per process shared
+by all sync-only code, so these views would query one at a time per worker.
+Instead each view body (authentication, query and serialization) runs
+through sync_to_async(thread_sensitive=False) on a pool of ASYNC_DB_THREADS
+threads, so up to that many requests per worker use the database at once.
+Those threads are outside Django's request cycle, so their connections are
+closed (or handed back to the pool) after every request: CONN_MAX_AGE is 0
+under ASGI.
+
+Rows are the same as from the DRF counterparts, the list envelope is not:
+lists use keyset pagination on id and return {"next": ..., "results": [...]},
+where `next` carries `?after=<last id>` and there is no `previous`. These
+views skip the response cache and ETags of the DRF endpoints, so every
+request reads the database. Authentication is the same token header,
+checked against the shared token cache first.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+
+from movierater import database_router
+
+from . import metrics
+from .authentication import cache_entry, cached_user, token_cache_key
+from .models import Movie, Rating
+from .pagination import MovieCursorPagination, RatingCursorPagination
+from .serializers import MovieValuesSerializer, RatingValuesSerializer
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS,
+                                           thread_name_prefix='async-db')
+        return _executor
+
+
+def authenticate(request):
+    """The user for a `Token <key>` header, or None."""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0].lower() != 'token':
+        return None
+    cache_key = token_cache_key(parts[1])
+    entry = cache.get(cache_key)
+    metrics.cache_lookup('token', entry is not None)
+    if entry is None:
+        try:
+            token = Token.objects.select_related('user').get(key=parts[1])
+        except Token.DoesNotExist:
+            return None
+        user = token.user
+        cache.set(cache_key, cache_entry(user), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    else:
+        user = cached_user(entry)
+    if not user.is_active:
+        return None
+    database_router.pin_request(user.id)
+    return user
+
+
+def db_thread_view(view):
+    """
+    An async view that runs the sync `view` on the database threads.
+
+    Requests without a valid token get a 401 before `view` is called.
+    """
+    def run(request, *args, **kwargs):
+        try:
+            if authenticate(request) is None:
+                return _unauthorized()
+            return view(request, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False, executor=_pool())(
+            request, *args, **kwargs)
+    return async_view
+
+
+def _unauthorized():
+    response = JsonResponse(
+        {'detail': 'Authentication credentials were not provided.'}, status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def _page_size(request, pagination):
+    try:
+        size = int(request.GET.get('page_size', pagination.page_size))
+    except ValueError:
+        size = pagination.page_size
+    return max(1, min(size, pagination.max_page_size))
+
+
+def _keyset_page(request, queryset, serializer_class, pagination):
+    """One page of rows with id > ?after=, plus the link to the next."""
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+    size = _page_size(request, pagination)
+    columns = serializer_class().columns()
+    queryset = queryset.filter(id__gt=after).order_by('id').values(*columns)
+    rows = list(queryset[:size + 1])
+
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        query = request.GET.copy()
+        query['after'] = rows[-1]['id']
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return JsonResponse({
+        'next': next_url,
+        'results': serializer_class(rows, many=True).data,
+    })
+
+
+@require_GET
+@db_thread_view
+def movie_list(request):
+    return _keyset_page(request, Movie.objects.all(), MovieValuesSerializer,
+                        MovieCursorPagination)
+
+
+@require_GET
+@db_thread_view
+def movie_detail(request, pk):
+    columns = MovieValuesSerializer().columns()
+    try:
+        movie = Movie.objects.values(*columns).get(pk=pk)
+    except Movie.DoesNotExist:
+        return JsonResponse({'detail': 'No Movie matches the given query.'}, status=404)
+    return JsonResponse(MovieValuesSerializer(movie).data)
+
+
+@require_GET
+@db_thread_view
+def rating_list(request):
+    return _keyset_page(request, Rating.objects.all(), RatingValuesSerializer,
+                        RatingCursorPagination)
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from movierater import database_router
+
+from . import metrics
+
+
+def token_cache_key(key):
+    # hash the token so raw credentials never end up in cache keys or files
+    return 'api:token-user:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def cache_entry(user):
+    # only what authentication and permissions read: no key, no password hash
+    return (user.id, user.is_active, user.is_staff)
+
+
+def cached_user(entry):
+    """Rebuild the user of a cached token lookup."""
+    user_id, is_active, is_staff = entry
+    user = User(id=user_id, is_active=is_active, is_staff=is_staff)
+    user._state.adding = False
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers token lookups in Django's cache.
+
+    A hit skips the token/user query entirely. The cache holds only the
+    user's id and flags, never the token or the user row. Entries live for
+    AUTH_TOKEN_CACHE_TIMEOUT seconds and are dropped as soon as the token is
+    deleted or its user is saved (for example deactivated), see api.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        entry = cache.get(cache_key)
+        metrics.cache_lookup('token', entry is not None)
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, cache_entry(user), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        else:
+            user = cached_user(entry)
+            token = Token(key=key, user=user)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # users who just voted read from the primary until replicas catch up
+        database_router.pin_request(user.id)
+        return (user, token)
+
+
+def forget_tokens(keys):
+    """Remove cached lookups for the given token keys."""
+    cache.delete_many([token_cache_key(key) for key in keys])
@@ -0,0 +1,338 @@
+"""
+Synthetic datasets and an endpoint latency benchmark.
+
+generate() fills the database with a synthetic catalogue at a chosen
+scale. run() drives the main API endpoints, either in-process through
+Django's test client, where it also counts SQL queries, or over HTTP
+against a running server such as a local gunicorn. It reports
+p50/p95/p99 latency, throughput and queries per request for each endpoint.
+compare() checks a report against a saved baseline and lists the
+regressions. serialization() measures the serializer and renderer paths
+on their own.
+
+Used by `manage.py seed_synthetic_data` and `manage.py benchmark_api`.
+"""
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, router, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from . import aggregates, importer
+from .models import Movie, Rating
+
+SYNTHETIC_TITLE = 'Synthetic movie'
+SYNTHETIC_USER = 'synthetic-'
+BENCH_USER = 'bench-user'
+BENCH_PASSWORD = 'bench-password'
+
+ENDPOINTS = ('movies_list', 'movie_detail', 'rate_movie', 'ratings_list', 'auth',
+             'async_movies_list', 'async_movie_detail', 'async_ratings_list')
+
+
+# -- synthetic data -------------------------------------------------------
+
+def generate(movies, ratings, users=None, seed=0, batch_size=50000, log=None):
+    """
+    Add a synthetic catalogue of `movies` movies and about `ratings` ratings.
+
+    Ratings are spread over `users` users (default: one user per 100
+    ratings) with a skew towards popular movies, as in real catalogues.
+    """
+    rng = random.Random(seed)
+    users = users or max(1, ratings // 100)
+    log = log or (lambda message: None)
+
+    first = Movie.objects.count()
+    for start in range(0, movies, 10000):
+        with transaction.atomic():
+            Movie.objects.bulk_create(
+                [Movie(title=f'{SYNTHETIC_TITLE} {first + n}',
+                       description=f'Synthetic description for movie {first + n}')
+                 for n in range(start, min(start + 10000, movies))],
+                batch_size=1000)
+    movie_ids = list(Movie.objects.filter(title__startswith=SYNTHETIC_TITLE)
+                     .order_by('id').values_list('id', flat=True))
+    log(f'{len(movie_ids)} synthetic movies')
+
+    password = make_password(None)
+    existing = set(User.objects.filter(username__startswith=SYNTHETIC_USER)
+                   .values_list('username', flat=True))
+    names = [f'{SYNTHETIC_USER}{n}' for n in range(users)]
+    User.objects.bulk_create(
+        [User(username=name, password=password) for name in names if name not in existing],
+        batch_size=1000)
+    user_ids = list(User.objects.filter(username__startswith=SYNTHETIC_USER)
+                    .values_list('id', flat=True))
+    log(f'{len(user_ids)} synthetic users')
+
+    # popularity skew: weight movie i by 1 / (i + 1). choices() would sum
+    # plain weights again on every call, so pass them cumulated once
+    cum_weights = list(itertools.accumulate(1 / (n + 1) for n in range(len(movie_ids))))
+    per_user = max(1, min(len(movie_ids), ratings // len(user_ids)))
+    votes, written = {}, 0
+    for user_id in user_ids:
+        picks = set(rng.choices(movie_ids, cum_weights=cum_weights, k=per_user))
+        for movie_id in picks:
+            votes[(user_id, movie_id)] = rng.randint(1, 5)
+        if len(votes) >= batch_size:
+            with transaction.atomic():
+                written += importer.write_ratings(votes)
+            votes = {}
+            log(f'{written} ratings')
+    if votes:
+        with transaction.atomic():
+            written += importer.write_ratings(votes)
+
+    aggregates.rebuild()
+    log(f'{written} synthetic ratings')
+    return written
+
+
+def _delete_synthetic_ratings():
+    """Delete every rating of a synthetic movie or user in one statement."""
+    db = connections[router.db_for_write(Rating)]
+    ratings, movies, users = (db.ops.quote_name(model._meta.db_table)
+                              for model in (Rating, Movie, User))
+    with db.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {ratings} '
+            f'WHERE movie_id IN (SELECT id FROM {movies} WHERE title LIKE %s) '
+            f'OR user_id IN (SELECT id FROM {users} WHERE username LIKE %s)',
+            [f'{SYNTHETIC_TITLE}%', f'{SYNTHETIC_USER}%'])
+
+
+def clear():
+    """
+    Delete synthetic movies and users.
+
+    Their ratings go first, in one DELETE without per-row signals; the
+    real movies that synthetic users voted on are then recounted once.
+    """
+    voted = set(Rating.objects.filter(user__username__startswith=SYNTHETIC_USER)
+                .exclude(movie__title__startswith=SYNTHETIC_TITLE)
+                .values_list('movie_id', flat=True).distinct())
+    with transaction.atomic():
+        _delete_synthetic_ratings()
+        if voted:
+            aggregates.rebuild(voted)
+        Movie.objects.filter(title__startswith=SYNTHETIC_TITLE).delete()
+        User.objects.filter(username__startswith=SYNTHETIC_USER).delete()
+
+
+# -- benchmark ------------------------------------------------------------
+
+def bench_user():
+    user, created = User.objects.get_or_create(username=BENCH_USER)
+    if created or not user.check_password(BENCH_PASSWORD):
+        user.set_password(BENCH_PASSWORD)
+        user.save()
+    token, _ = Token.objects.get_or_create(user=user)
+    return user, token.key
+
+
+def _requests(endpoint, movie_ids, rng):
+    """(method, path, body) for one request to an endpoint."""
+    if endpoint == 'movies_list':
+        return 'GET', '/api/movies/', None
+    if endpoint == 'movie_detail':
+        return 'GET', f'/api/movies/{rng.choice(movie_ids)}/', None
+    if endpoint == 'rate_movie':
+        return ('POST', f'/api/movies/{rng.choice(movie_ids)}/rate_movie/',
+                {'stars': rng.randint(1, 5)})
+    if endpoint == 'ratings_list':
+        return 'GET', '/api/ratings/', None
+    if endpoint == 'async_movies_list':
+        return 'GET', '/api/async/movies/', None
+    if endpoint == 'async_movie_detail':
+        return 'GET', f'/api/async/movies/{rng.choice(movie_ids)}/', None
+    if endpoint == 'async_ratings_list':
+        return 'GET', '/api/async/ratings/', None
+    if endpoint == 'auth':
+        return 'POST', '/auth/', {'username': BENCH_USER, 'password': BENCH_PASSWORD}
+    raise ValueError(f'Unknown endpoint {endpoint}')
+
+
+class InProcessDriver:
+    """Calls the API through Django's test client and counts queries."""
+
+    def __init__(self, token):
+        # 'localhost' is allowed by ALLOWED_HOSTS in every mode
+        self.client = Client(HTTP_HOST='localhost',
+                             HTTP_AUTHORIZATION=f'Token {token}')
+
+    def __call__(self, method, path, body):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, body, content_type='application/json')
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries)
+
+
+class HttpDriver:
+    """Calls a running server over HTTP; query counts are not visible."""
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Authorization': f'Token {self.token}',
+                     'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                code = response.status
+        except urllib.error.HTTPError as error:
+            code = error.code
+        return code, time.perf_counter() - started, None
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run(endpoints=ENDPOINTS, requests=200, warmup=10, base_url=None,
+        concurrency=1, seed=0):
+    """
+    Benchmark each endpoint and return a report dict keyed by endpoint.
+
+    Times are in milliseconds. concurrency > 1 sends requests from that many
+    threads, which is only meaningful against a running server (base_url).
+    """
+    rng = random.Random(seed)
+    movie_ids = list(Movie.objects.order_by('-id').values_list('id', flat=True)[:10000])
+    if not movie_ids:
+        raise ValueError('No movies to benchmark; run seed_synthetic_data first')
+    _, token = bench_user()
+
+    local = threading.local()
+
+    def driver():
+        if not hasattr(local, 'driver'):
+            local.driver = (HttpDriver(token, base_url) if base_url
+                            else InProcessDriver(token))
+        return local.driver
+
+    report = {}
+    for endpoint in endpoints:
+        calls = [_requests(endpoint, movie_ids, rng) for _ in range(warmup + requests)]
+        for call in calls[:warmup]:
+            driver()(*call)
+
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = list(pool.map(lambda call: driver()(*call), calls[warmup:]))
+        else:
+            results = [driver()(*call) for call in calls[warmup:]]
+        wall = time.perf_counter() - started
+
+        latencies = [elapsed * 1000 for _, elapsed, _ in results]
+        queries = [count for _, _, count in results if count is not None]
+        errors = sum(1 for code, _, _ in results if code >= 400)
+        report[endpoint] = {
+            'requests': len(results),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'throughput_rps': round(len(results) / wall, 1),
+            'queries': round(statistics.fmean(queries), 2) if queries else None,
+        }
+    return report
+
+
+def serialization(rows=5000, repeat=5):
+    """
+    Rows per second of each serialization path, on one core.
+
+    Times model serializers + DRF's JSONRenderer (the old path) against
+    values() rows + ValuesSerializer with the orjson and MessagePack
+    renderers, for the first `rows` movies and ratings. Query time is
+    included, since loading rows is part of each path.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from .renderers import MessagePackRenderer, ORJSONRenderer
+    from .serializers import (MovieSerializer, MovieValuesSerializer,
+                              RatingSerializer, RatingValuesSerializer)
+
+    def model_path(model, serializer_class, renderer):
+        def run():
+            instances = list(model.objects.order_by('id')[:rows])
+            renderer.render(serializer_class(instances, many=True).data)
+            return len(instances)
+        return run
+
+    def values_path(model, serializer_class, renderer):
+        def run():
+            columns = serializer_class().columns()
+            values = list(model.objects.order_by('id').values(*columns)[:rows])
+            renderer.render(serializer_class(values, many=True).data)
+            return len(values)
+        return run
+
+    paths = {
+        'movies model+json': model_path(Movie, MovieSerializer, JSONRenderer()),
+        'movies values+orjson': values_path(Movie, MovieValuesSerializer, ORJSONRenderer()),
+        'movies values+msgpack': values_path(Movie, MovieValuesSerializer, MessagePackRenderer()),
+        'ratings model+json': model_path(Rating, RatingSerializer, JSONRenderer()),
+        'ratings values+orjson': values_path(Rating, RatingValuesSerializer, ORJSONRenderer()),
+        'ratings values+msgpack': values_path(Rating, RatingValuesSerializer, MessagePackRenderer()),
+    }
+    report = {}
+    for name, run in paths.items():
+        run()  # warm up
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            count = run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        report[name] = {'rows': count, 'rows_per_second': round(count / best) if best else 0}
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Regressions of a report against a baseline report.
+
+    An endpoint regresses when its p95 latency grows by more than
+    `tolerance` (a fraction) or it runs more queries per request.
+    """
+    regressions = []
+    for endpoint, result in report.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{endpoint}: p95 {result['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if (result.get('queries') is not None and base.get('queries') is not None
+                and result['queries'] > base['queries']):
+            regressions.append(
+                f"{endpoint}: {result['queries']} queries vs baseline {base['queries']}")
+    return regressions
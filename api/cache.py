@@ -0,0 +1,97 @@
+"""
+Version keys for cached movie responses.
+
+Cached list and detail responses are stored under keys that embed a version
+number. Writes never delete cached responses; they bump the version instead,
+so the next read misses and stale entries simply age out. There is one
+version for the movie collection and one per movie. A full reset version
+covers bulk changes that touch every movie at once.
+
+Versions are nanosecond timestamps, so they also serve as Last-Modified
+times and ETag material.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+COLLECTION_KEY = 'api:movies:version'
+RESET_KEY = 'api:movies:reset'
+
+
+def _movie_key(movie_id):
+    return f'api:movie:{movie_id}:version'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _read(keys, optional=()):
+    """Versions of keys; missing ones start now, except `optional` ones (0)."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions and key not in optional]
+    if missing:
+        # unknown (or evicted) versions start now, which also invalidates
+        # anything cached under an older value
+        version = _new_version()
+        for key in missing:
+            cache.add(key, version, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def collection_version():
+    """Version of the movie collection as a whole."""
+    return _read([COLLECTION_KEY])[0]
+
+
+def movie_version(movie_id, create=True):
+    """
+    Version of a single movie.
+
+    With create=False a movie without a version gets None rather than a new
+    one, so requests for ids that may not exist leave no key behind.
+    """
+    key = _movie_key(movie_id)
+    version, reset = _read([key, RESET_KEY], optional=() if create else (key, ))
+    if not version and not create:
+        return None
+    return max(version, reset)
+
+
+def _bump(movie_ids=None):
+    version = _new_version()
+    versions = {COLLECTION_KEY: version}
+    if movie_ids is None:
+        versions[RESET_KEY] = version
+    else:
+        versions.update({_movie_key(movie_id): version for movie_id in movie_ids})
+    cache.set_many(versions, timeout=None)
+
+
+def bump(movie_ids=None):
+    """
+    Invalidate cached responses for the given movies and every list.
+
+    Pass None to invalidate all movies. Inside a transaction the bump waits
+    for the commit, so readers never cache data that is about to roll back.
+    """
+    if movie_ids is not None:
+        movie_ids = list(movie_ids)
+    transaction.on_commit(lambda: _bump(movie_ids))
+
+
+def response_key(prefix, request, version, *parts):
+    """Cache key for a response, varying on the query string and format."""
+    query = hashlib.sha1(request.GET.urlencode().encode()).hexdigest()
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = getattr(renderer, 'format', '')
+    return ':'.join(str(part) for part in
+                    (prefix, *parts, version, media_type, query))
+
+
+def timeout():
+    return settings.API_CACHE_TIMEOUT
@@ -0,0 +1,118 @@
+"""
+Streaming rating exports as NDJSON or CSV.
+
+Rows are read with QuerySet.iterator(), which uses a server-side cursor on
+PostgreSQL and chunked fetches elsewhere. Output is produced in batches as
+the rows arrive, so memory stays flat however large the table is. Used by
+GET /api/ratings/export/ and `manage.py export_ratings`; under ASGI the
+endpoint streams through astream(), an async iterator over the same batches.
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+
+from .models import Rating
+
+COLUMNS = {
+    'id': 'id',
+    'movie': 'movie_id',
+    'user': 'user_id',
+    'stars': 'stars',
+}
+NAME_COLUMNS = {
+    'movie_title': 'movie__title',
+    'username': 'user__username',
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def ratings(movie=None, user=None, min_id=None, max_id=None, names=False):
+    """
+    Header and row queryset for an export, in id order.
+
+    min_id and max_id are inclusive; names adds movie titles and usernames
+    through a join.
+    """
+    columns = dict(COLUMNS, **NAME_COLUMNS) if names else COLUMNS
+    queryset = Rating.objects.order_by('id')
+    if movie is not None:
+        queryset = queryset.filter(movie_id=movie)
+    if user is not None:
+        queryset = queryset.filter(user_id=user)
+    if min_id is not None:
+        queryset = queryset.filter(id__gte=min_id)
+    if max_id is not None:
+        queryset = queryset.filter(id__lte=max_id)
+    return list(columns), queryset.values_list(*columns.values())
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson(header, rows):
+    return ''.join(json.dumps(dict(zip(header, row))) + '\n' for row in rows)
+
+
+def _csv(header, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _no_head(header):
+    return ''
+
+
+def _csv_head(header):
+    return _csv(header, [header])
+
+
+# (text before the first row, text for a batch of rows) per output format
+WRITERS = {
+    'ndjson': (_no_head, _ndjson),
+    'csv': (_csv_head, _csv),
+}
+
+
+def stream(output, header, queryset, chunk_size=2000):
+    """Text chunks for the given output format ('ndjson' or 'csv')."""
+    head, write = WRITERS[output]
+    text = head(header)
+    for batch in _batches(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield text + write(header, batch)
+        text = ''
+    if text:
+        yield text
+
+
+async def astream(output, header, queryset, chunk_size=2000):
+    """
+    stream() as an async iterator, for responses served under ASGI.
+
+    Django would otherwise read a sync stream to the end in a thread before
+    sending any of it. Each batch is fetched on the thread Django runs sync
+    code on; QuerySet.aiterator() would run a values_list() query in the
+    event loop itself.
+    """
+    head, write = WRITERS[output]
+    text = head(header)
+    batches = _batches(queryset.iterator(chunk_size=chunk_size), chunk_size)
+    next_batch = sync_to_async(next)
+    while (batch := await next_batch(batches, None)) is not None:
+        yield text + write(header, batch)
+        text = ''
+    if text:
+        yield text
@@ -0,0 +1,256 @@
+"""
+Locally stored movie posters and their thumbnails.
+
+POST /api/movies/upload_image/ streams the upload to a temporary file in
+chunks through HashingUploadHandler, which computes its SHA-256 on the way,
+so a large poster is never held in memory. Files are stored by that hash
+under MEDIA_ROOT/posters/, so the same image uploaded twice (or for two
+movies) is stored once:
+
+    posters/ab/<sha256>/original.jpg
+    posters/ab/<sha256>/small.webp, small.jpg, medium.webp, ...
+
+Thumbnails of every THUMBNAIL_SIZES entry, in WebP and JPEG, are made by a
+small thread pool after the upload returns. image_view serves them, and the
+original, with immutable cache headers: a hash names exactly one image, so
+clients and CDNs never need to revalidate. A thumbnail requested before the
+pool got to it is made on the spot.
+
+With object storage configured (see api.storage) originals are also copied
+to the bucket, and an image uploaded straight to the bucket is fetched from
+there the first time one of its thumbnails is needed.
+"""
+import hashlib
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.urls import Resolver404, resolve, reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import storage
+
+# accepted upload formats and the extension they are stored under
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+# thumbnail extension: Pillow format
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png',
+                 'webp': 'image/webp', 'gif': 'image/gif'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+SHA256 = re.compile(r'[0-9a-f]{64}')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Write uploads to a temporary file, hashing them chunk by chunk.
+
+    The finished file carries its hex digest as `sha256`. Files larger than
+    IMAGE_UPLOAD_MAX_BYTES are dropped as soon as they cross the limit.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise SkipFile
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.sha256.hexdigest()
+        return upload
+
+
+def _directory(sha256):
+    return Path(settings.MEDIA_ROOT) / 'posters' / sha256[:2] / sha256
+
+
+def _original(sha256):
+    """Path of the stored original, or None."""
+    directory = _directory(sha256)
+    for extension in FORMATS.values():
+        path = directory / f'original.{extension}'
+        if path.exists():
+            return path
+    return None
+
+
+def _fetch_original(sha256):
+    """Copy an original from object storage to local disk; its path or None."""
+    if not storage.configured():
+        return None
+    directory = _directory(sha256)
+    directory.mkdir(parents=True, exist_ok=True)
+    for extension in FORMATS.values():
+        partial = directory / f'.{uuid.uuid4().hex}.part'
+        if storage.download(storage.poster_key(sha256, extension), partial):
+            path = directory / f'original.{extension}'
+            os.replace(partial, path)
+            return path
+    return None
+
+
+def _source(sha256):
+    return _original(sha256) or _fetch_original(sha256)
+
+
+def image_url(sha256, name, extension):
+    return reverse('image', kwargs={'sha256': sha256, 'name': name,
+                                    'extension': extension})
+
+
+def thumbnail_url(sha256, size='small', extension='webp'):
+    return image_url(sha256, size, extension)
+
+
+def original_url(sha256):
+    """URL path of a stored original, or None if there is none."""
+    if not SHA256.fullmatch(sha256):
+        return None
+    original = _original(sha256)
+    if original is None:
+        return None
+    return image_url(sha256, 'original', original.suffix[1:])
+
+
+def sha256_from_url(url):
+    """The hash of a stored image from its URL, '' for any other URL."""
+    if storage.configured() and url:
+        sha256 = storage.poster_sha256(url)
+        if sha256:
+            return sha256
+    try:
+        match = resolve(urlsplit(url or '').path)
+    except Resolver404:
+        return ''
+    return match.kwargs['sha256'] if match.url_name == 'image' else ''
+
+
+def store(upload):
+    """
+    Store an upload from HashingUploadHandler; returns (sha256, extension).
+
+    An image already stored under the same hash is not written again.
+    Raises InvalidImage if the file is not a JPEG, PNG, WebP or GIF image,
+    and storage.StorageError if copying it to the bucket fails.
+    """
+    path = upload.temporary_file_path()
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            image_format = image.format
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidImage('The file is not a readable image')
+    if image_format not in FORMATS:
+        raise InvalidImage(f'{image_format} images are not supported')
+
+    sha256, extension = upload.sha256, FORMATS[image_format]
+    original = _original(sha256)
+    if original is None:
+        directory = _directory(sha256)
+        directory.mkdir(parents=True, exist_ok=True)
+        # move beside the target, then rename over it: readers never see a
+        # partial file, and concurrent uploads of one image both succeed
+        original = directory / f'original.{extension}'
+        partial = directory / f'.{uuid.uuid4().hex}.part'
+        file_move_safe(path, partial)
+        os.replace(partial, original)
+    if storage.configured():
+        key = storage.poster_key(sha256, original.suffix[1:])
+        if not storage.exists(key):
+            with original.open('rb') as file:
+                storage.upload(file, key, CONTENT_TYPES[original.suffix[1:]])
+    schedule_thumbnails(sha256)
+    return sha256, original.suffix[1:]
+
+
+def public_url(sha256, extension):
+    """Where an original is served from: the bucket if there is one."""
+    if storage.configured():
+        return storage.public_url(storage.poster_key(sha256, extension))
+    return image_url(sha256, 'original', extension)
+
+
+def make_thumbnail(sha256, size, extension):
+    """Write one thumbnail of the stored original; returns its path."""
+    original = _source(sha256)
+    if original is None:
+        raise FileNotFoundError(sha256)
+    target = _directory(sha256) / f'{size}.{extension}'
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        thumbnail = ImageOps.fit(image, settings.THUMBNAIL_SIZES[size],
+                                 Image.Resampling.LANCZOS)
+    partial = target.with_name(f'.{uuid.uuid4().hex}.part')
+    thumbnail.save(partial, THUMBNAIL_FORMATS[extension],
+                   quality=settings.THUMBNAIL_QUALITY)
+    os.replace(partial, target)
+    return target
+
+
+def make_thumbnails(sha256):
+    """Make every missing thumbnail of an image."""
+    directory = _directory(sha256)
+    for size in settings.THUMBNAIL_SIZES:
+        for extension in THUMBNAIL_FORMATS:
+            if not (directory / f'{size}.{extension}').exists():
+                make_thumbnail(sha256, size, extension)
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS,
+                                           thread_name_prefix='thumbnails')
+        return _executor
+
+
+def schedule_thumbnails(sha256):
+    """Make the thumbnails of an image in the background."""
+    return _pool().submit(make_thumbnails, sha256)
+
+
+@require_GET
+def image_view(request, sha256, name, extension):
+    """
+    A stored original or thumbnail, cacheable forever.
+
+    Content-addressed: the URL changes whenever the image does.
+    """
+    etag = f'"{sha256}-{name}.{extension}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        path = _directory(sha256) / f'{name}.{extension}'
+        if not path.exists():
+            if (name not in settings.THUMBNAIL_SIZES or extension not in THUMBNAIL_FORMATS
+                    or _source(sha256) is None):
+                raise Http404
+            path = make_thumbnail(sha256, name, extension)
+        response = FileResponse(path.open('rb'), content_type=CONTENT_TYPES[extension])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
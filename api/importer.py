@@ -0,0 +1,230 @@
+"""
+Bulk import of MovieLens-style datasets.
+
+movies.csv (movieId,title,genres) and ratings.csv (userId,movieId,rating,...)
+are read in batches of lines and never loaded whole. Each batch is written
+in one transaction together with an ImportCheckpoint that records the byte
+offset reached, so an interrupted import resumes at the first uncommitted
+batch and never writes a row twice.
+
+External movie ids are mapped through ExternalMovie. Dataset users become
+accounts named "<source>-<userId>" with unusable passwords. Ratings are
+written with the fastest path the database offers: COPY into a temporary
+table on PostgreSQL, fast_executemany on SQL Server and bulk_create
+elsewhere. No per-row signals fire, so the caller rebuilds the movie
+aggregates once at the end.
+
+Lines are parsed one at a time, so quoted fields must not span lines
+(MovieLens files never do).
+"""
+import csv
+import io
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+
+from .models import ExternalMovie, ImportCheckpoint, Movie, Rating
+
+
+def read_batches(path, offset, batch_size):
+    """
+    Yield (rows, end_offset) batches of parsed CSV rows.
+
+    Starts at a byte offset from a checkpoint; offset 0 skips the header.
+    """
+    with open(path, 'rb') as source:
+        if offset:
+            source.seek(offset)
+        else:
+            source.readline()
+        lines = []
+        while True:
+            line = source.readline()
+            if line.strip():
+                lines.append(line.decode('utf-8'))
+            if lines and (not line or len(lines) >= batch_size):
+                yield list(csv.reader(lines)), source.tell()
+                lines = []
+            if not line:
+                break
+
+
+def checkpoint(source, kind, restart=False):
+    point, _ = ImportCheckpoint.objects.get_or_create(source=source, kind=kind)
+    if restart:
+        point.offset, point.rows, point.finished = 0, 0, False
+        point.save()
+    return point
+
+
+def _advance(point, end_offset, rows):
+    point.offset = end_offset
+    point.rows += rows
+    point.save(update_fields=['offset', 'rows', 'updated'])
+
+
+def movie_map(source):
+    """{external id: movie id} for everything already imported from source."""
+    return dict(ExternalMovie.objects.filter(source=source)
+                .values_list('external_id', 'movie_id'))
+
+
+def import_movies(path, source, batch_size=10000, restart=False, known=None):
+    """Import movies.csv; returns the number of new movies."""
+    point = checkpoint(source, 'movies', restart)
+    if point.finished:
+        return 0
+    known = movie_map(source) if known is None else known
+    can_return_ids = connections[router.db_for_write(Movie)] \
+        .features.can_return_rows_from_bulk_insert
+
+    created = 0
+    for rows, end_offset in read_batches(path, point.offset, batch_size):
+        pending = {}
+        for row in rows:
+            if len(row) < 2 or row[0] in known:
+                continue
+            genres = row[2].replace('|', ', ') if len(row) > 2 else ''
+            pending[row[0]] = Movie(
+                title=row[1][:150],
+                description=f'Genres: {genres}'[:360] if genres else '',
+            )
+
+        with transaction.atomic():
+            if can_return_ids:
+                Movie.objects.bulk_create(pending.values(), batch_size=1000)
+            else:
+                for movie in pending.values():
+                    movie.save()
+            ExternalMovie.objects.bulk_create(
+                [ExternalMovie(source=source, external_id=external_id, movie=movie)
+                 for external_id, movie in pending.items()],
+                batch_size=1000)
+            _advance(point, end_offset, len(rows))
+
+        known.update({external_id: movie.id for external_id, movie in pending.items()})
+        created += len(pending)
+
+    point.finished = True
+    point.save(update_fields=['finished', 'updated'])
+    return created
+
+
+def _user_ids(usernames, users):
+    """Make sure accounts exist for the given usernames; fills users in place."""
+    missing = [name for name in usernames if name not in users]
+    if not missing:
+        return
+    password = make_password(None)
+    User.objects.bulk_create(
+        [User(username=name, password=password) for name in missing],
+        batch_size=1000)
+    for start in range(0, len(missing), 1000):
+        users.update(User.objects.filter(username__in=missing[start:start + 1000])
+                     .values_list('username', 'id'))
+
+
+def _stars(value):
+    # MovieLens uses half stars from 0.5 to 5.0; round half up into 1-5
+    return max(1, min(5, int(float(value) + 0.5)))
+
+
+def _write_postgresql(connection, cursor, table, votes):
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS rating_import '
+                   '(user_id bigint, movie_id bigint, stars integer) '
+                   'ON COMMIT DELETE ROWS')
+    data = ''.join(f'{user_id}\t{movie_id}\t{stars}\n'
+                   for (user_id, movie_id), stars in votes.items())
+    copy = 'COPY rating_import (user_id, movie_id, stars) FROM STDIN'
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        raw.copy_expert(copy, io.StringIO(data))  # psycopg2
+    else:
+        with raw.copy(copy) as stream:  # psycopg 3
+            stream.write(data)
+    cursor.execute(f'INSERT INTO {table} (user_id, movie_id, stars) '
+                   f'SELECT user_id, movie_id, stars FROM rating_import '
+                   f'ON CONFLICT (user_id, movie_id) DO NOTHING')
+    return cursor.rowcount
+
+
+def _write_mssql(connection, cursor, table, votes):
+    cursor.execute("IF OBJECT_ID('tempdb..#rating_import') IS NULL "
+                   'CREATE TABLE #rating_import '
+                   '(user_id bigint, movie_id bigint, stars int)')
+    raw = cursor.cursor
+    raw = getattr(raw, 'cursor', raw)  # the pyodbc cursor under mssql-django's wrapper
+    raw.fast_executemany = True
+    raw.executemany('INSERT INTO #rating_import (user_id, movie_id, stars) VALUES (?, ?, ?)',
+                    [(user_id, movie_id, stars)
+                     for (user_id, movie_id), stars in votes.items()])
+    # SQL Server has no ON CONFLICT: leave out the votes already stored
+    cursor.execute(f'INSERT INTO {table} (user_id, movie_id, stars) '
+                   f'SELECT user_id, movie_id, stars FROM #rating_import AS new '
+                   f'WHERE NOT EXISTS (SELECT 1 FROM {table} AS old '
+                   f'WHERE old.user_id = new.user_id AND old.movie_id = new.movie_id)')
+    written = cursor.rowcount
+    cursor.execute('TRUNCATE TABLE #rating_import')
+    return written
+
+
+def write_ratings(votes):
+    """
+    Insert {(user_id, movie_id): stars} with the database's fastest path.
+
+    Votes already stored are left as they are; returns how many were new.
+    """
+    connection = connections[router.db_for_write(Rating)]
+    table = connection.ops.quote_name(Rating._meta.db_table)
+    writers = {'postgresql': _write_postgresql, 'microsoft': _write_mssql}
+    writer = writers.get(connection.vendor)
+    if writer is None:
+        # ignore_conflicts does not say which rows it skipped, so look first
+        stored = set(Rating.objects.filter(user_id__in={user_id for user_id, _ in votes})
+                     .values_list('user_id', 'movie_id').iterator(chunk_size=10000))
+        Rating.objects.bulk_create(
+            [Rating(user_id=user_id, movie_id=movie_id, stars=stars)
+             for (user_id, movie_id), stars in votes.items()
+             if (user_id, movie_id) not in stored],
+            batch_size=5000,
+            ignore_conflicts=connection.features.supports_ignore_conflicts)
+        return len(votes.keys() - stored)
+    with connection.cursor() as cursor:
+        return writer(connection, cursor, table, votes)
+
+
+def import_ratings(path, source, batch_size=50000, restart=False, known=None):
+    """
+    Import ratings.csv; returns (rows written, rows skipped).
+
+    Rows for movies that were not imported from the same source are skipped,
+    and so are votes that are already stored.
+    """
+    point = checkpoint(source, 'ratings', restart)
+    if point.finished:
+        return 0, 0
+    known = movie_map(source) if known is None else known
+    prefix = f'{source}-'
+    users = dict(User.objects.filter(username__startswith=prefix)
+                 .values_list('username', 'id'))
+
+    written = skipped = 0
+    for rows, end_offset in read_batches(path, point.offset, batch_size):
+        with transaction.atomic():
+            _user_ids(list({prefix + row[0] for row in rows if row}), users)
+            votes = {}
+            for row in rows:
+                movie_id = known.get(row[1]) if len(row) > 2 else None
+                if movie_id is None:
+                    skipped += 1
+                    continue
+                votes[(users[prefix + row[0]], movie_id)] = _stars(row[2])
+            inserted = write_ratings(votes) if votes else 0
+            _advance(point, end_offset, len(rows))
+        written += inserted
+        skipped += len(votes) - inserted
+
+    point.finished = True
+    point.save(update_fields=['finished', 'updated'])
+    return written, skipped
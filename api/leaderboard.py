@@ -0,0 +1,28 @@
+"""
+Top-rated leaderboard over the stored Movie.bayes_score.
+
+Scores are kept current by api.aggregates as votes arrive, and the
+(-bayes_score, id) index keeps them sorted, so neither query below scans
+the catalogue: top() reads the first N index entries and rank() counts the
+entries ahead of one movie.
+"""
+from django.db.models import Q
+
+from .models import Movie
+
+
+def top(limit=10):
+    """The highest ranked rated movies, best first (ties by id)."""
+    return (Movie.objects.filter(bayes_score__gt=0)
+            .order_by('-bayes_score', 'id')[:limit])
+
+
+def rank(movie):
+    """1-based leaderboard position of a movie, or None while it is unrated."""
+    if movie.bayes_score <= 0:
+        return None
+    ahead = Movie.objects.filter(
+        Q(bayes_score__gt=movie.bayes_score)
+        | Q(bayes_score=movie.bayes_score, id__lt=movie.id)
+    ).count()
+    return ahead + 1
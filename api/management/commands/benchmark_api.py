@@ -0,0 +1,96 @@
+"""
+Custom Django management command to measure API endpoint latency,
+throughput and query counts, and to compare them with a saved baseline.
+
+Runs against whichever database the settings select, e.g. SQLite by
+default or PostgreSQL with DEBUG=False DATABASE_URL=postgres://...
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main API endpoints and reports p50/p95/p99 latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoints',
+            default=','.join(benchmark.ENDPOINTS),
+            help=f'Comma separated endpoints (default: {",".join(benchmark.ENDPOINTS)})'
+        )
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Measured requests per endpoint (default: 200)')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Unmeasured warm-up requests per endpoint (default: 10)')
+        parser.add_argument(
+            '--base-url',
+            help='Benchmark a running server (e.g. http://127.0.0.1:8000) '
+                 'instead of calling Django in-process'
+        )
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Concurrent client threads, with --base-url (default: 1)')
+        parser.add_argument('--save-baseline', metavar='PATH',
+                            help='Write the report to PATH as the new baseline')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='Compare with the baseline at PATH and fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p95 growth over the baseline (default: 0.2)')
+        parser.add_argument(
+            '--serialization', action='store_true',
+            help='Measure serialization throughput (rows/s on one core) instead'
+        )
+        parser.add_argument('--rows', type=int, default=5000,
+                            help='Rows per serialization run (default: 5000)')
+
+    def handle(self, *args, **options):
+        if options['serialization']:
+            self.stdout.write(f"{'path':<26}{'rows':>8}{'rows/s':>12}")
+            for path, result in benchmark.serialization(options['rows']).items():
+                self.stdout.write(
+                    f"{path:<26}{result['rows']:>8}{result['rows_per_second']:>12}")
+            return
+
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(benchmark.ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        if options['concurrency'] > 1 and not options['base_url']:
+            raise CommandError('--concurrency needs --base-url')
+
+        try:
+            report = benchmark.run(
+                endpoints=endpoints,
+                requests=options['requests'],
+                warmup=options['warmup'],
+                base_url=options['base_url'],
+                concurrency=options['concurrency'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'endpoint':<20}{'p50':>9}{'p95':>9}{'p99':>9}"
+                          f"{'req/s':>9}{'queries':>9}{'errors':>8}")
+        for endpoint, result in report.items():
+            queries = '-' if result['queries'] is None else result['queries']
+            self.stdout.write(
+                f"{endpoint:<20}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                f"{result['p99_ms']:>9}{result['throughput_rps']:>9}"
+                f"{queries:>9}{result['errors']:>8}"
+            )
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as out:
+                json.dump(report, out, indent=2)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as source:
+                regressions = benchmark.compare(report, json.load(source),
+                                                options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions found:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
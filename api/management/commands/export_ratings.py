@@ -0,0 +1,58 @@
+"""
+Custom Django management command to stream ratings to a file or stdout
+as NDJSON or CSV, for analytics.
+"""
+
+from django.core.management.base import BaseCommand
+
+from api import export
+
+
+class Command(BaseCommand):
+    help = 'Streams ratings as NDJSON or CSV without loading them into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-format',
+            choices=sorted(export.FORMATS),
+            default='ndjson',
+            help='Output format (default: ndjson)'
+        )
+        parser.add_argument(
+            '--file',
+            help='Write to this file instead of stdout'
+        )
+        parser.add_argument('--movie', type=int, help='Only ratings for this movie id')
+        parser.add_argument('--user', type=int, help='Only ratings by this user id')
+        parser.add_argument('--min-id', type=int, help='Smallest rating id to export')
+        parser.add_argument('--max-id', type=int, help='Largest rating id to export')
+        parser.add_argument(
+            '--names',
+            action='store_true',
+            help='Include movie titles and usernames'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows fetched and written per batch (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        header, rows = export.ratings(
+            movie=options['movie'],
+            user=options['user'],
+            min_id=options['min_id'],
+            max_id=options['max_id'],
+            names=options['names'],
+        )
+        chunks = export.stream(options['output_format'], header, rows,
+                               options['chunk_size'])
+
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
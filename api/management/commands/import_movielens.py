@@ -0,0 +1,85 @@
+"""
+Custom Django management command to load a MovieLens-style dataset
+(movies.csv and ratings.csv) in large batches. Safe to re-run after a
+crash: it resumes from the last committed batch.
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import aggregates, importer
+
+
+class Command(BaseCommand):
+    help = 'Imports movies.csv and ratings.csv from a MovieLens-style dataset directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            help='Directory containing movies.csv and ratings.csv'
+        )
+        parser.add_argument(
+            '--source',
+            default='movielens',
+            help='Name of the dataset, used to map external ids (default: movielens)'
+        )
+        parser.add_argument(
+            '--movie-batch-size',
+            type=int,
+            default=10000,
+            help='Movies per transaction (default: 10000)'
+        )
+        parser.add_argument(
+            '--rating-batch-size',
+            type=int,
+            default=50000,
+            help='Ratings per transaction (default: 50000)'
+        )
+        parser.add_argument(
+            '--skip-ratings',
+            action='store_true',
+            help='Only import movies.csv'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore saved checkpoints and read the files from the start'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        source = options['source']
+        movies_path = os.path.join(directory, 'movies.csv')
+        ratings_path = os.path.join(directory, 'ratings.csv')
+        if not os.path.exists(movies_path):
+            raise CommandError(f'{movies_path} not found')
+        if not options['skip_ratings'] and not os.path.exists(ratings_path):
+            raise CommandError(f'{ratings_path} not found')
+
+        started = time.monotonic()
+        known = importer.movie_map(source)
+        created = importer.import_movies(
+            movies_path, source, options['movie_batch_size'],
+            restart=options['restart'], known=known)
+        self.stdout.write(f'Imported {created} new movies')
+
+        if options['skip_ratings']:
+            written = 0
+        else:
+            written, skipped = importer.import_ratings(
+                ratings_path, source, options['rating_batch_size'],
+                restart=options['restart'], known=known)
+            self.stdout.write(f'Imported {written} ratings ({skipped} skipped)')
+
+        # rating counts, histograms, leaderboard scores and cached responses
+        # are refreshed once for the whole load
+        self.stdout.write('Rebuilding rating aggregates...')
+        aggregates.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Import from {source} finished in {time.monotonic() - started:.1f}s'
+            )
+        )
@@ -0,0 +1,30 @@
+"""
+Custom Django management command to recompute the leaderboard scores,
+e.g. after changing RATING_PRIOR_MEAN or RATING_PRIOR_WEIGHT.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from api import aggregates
+from api.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the Bayesian leaderboard score of every movie'
+
+    def handle(self, *args, **options):
+        updated = aggregates.rescore()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rescored {updated} movies')
+        )
+
+        # report the observed mean so the prior can be tuned to match
+        totals = Movie.objects.aggregate(votes=Sum('rating_count'),
+                                         stars=Sum('rating_sum'))
+        if totals['votes']:
+            self.stdout.write(
+                f"Observed mean rating: {totals['stars'] / totals['votes']:.2f} "
+                f"(RATING_PRIOR_MEAN is {settings.RATING_PRIOR_MEAN})"
+            )
@@ -0,0 +1,46 @@
+"""
+Custom Django management command to fill the database with a synthetic
+catalogue for benchmarking, e.g. 1k movies / 100k ratings up to
+100k movies / 10M ratings.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic movies, users and ratings for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000,
+                            help='Number of movies to add (default: 1000)')
+        parser.add_argument('--ratings', type=int, default=100000,
+                            help='Approximate number of ratings (default: 100000)')
+        parser.add_argument('--users', type=int,
+                            help='Number of users (default: one per 100 ratings)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed, for reproducible datasets (default: 0)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously generated synthetic data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write('Removing previous synthetic data...')
+            benchmark.clear()
+
+        started = time.monotonic()
+        written = benchmark.generate(
+            movies=options['movies'],
+            ratings=options['ratings'],
+            users=options['users'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Generated {written} ratings in {time.monotonic() - started:.1f}s'
+            )
+        )
@@ -0,0 +1,128 @@
+"""
+Prometheus metrics for the API.
+
+RequestTimingMiddleware records every request here: counts and latency per
+view, queries and SQL time per request, and the state of the connection
+pools, including how many checkouts reused an open connection. The response
+cache, token authentication and presigned upload URLs record cache hits and
+misses.
+
+Under gunicorn each worker is a separate process. With
+PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py sets it), every worker writes
+its samples to memory-mapped files in that directory and /metrics merges
+them, so a scrape sees the totals of all workers whichever one serves it.
+"""
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+
+from movierater import db_pool
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250)
+
+requests_total = Counter(
+    'movierater_requests_total', 'HTTP requests',
+    ['view', 'method', 'status'])
+request_duration = Histogram(
+    'movierater_request_duration_seconds', 'Request latency',
+    ['view'], buckets=LATENCY_BUCKETS)
+db_queries = Histogram(
+    'movierater_db_queries_per_request', 'SQL queries per request',
+    ['view'], buckets=QUERY_BUCKETS)
+db_duration = Histogram(
+    'movierater_db_duration_seconds', 'SQL time per request',
+    ['view'], buckets=LATENCY_BUCKETS)
+cache_requests = Counter(
+    'movierater_cache_requests_total', 'Cache lookups',
+    ['cache', 'result'])
+
+# pool gauges are summed over live workers, so pool_max is the most
+# connections the deployment can open
+pool_max = Gauge(
+    'movierater_db_pool_max', 'Pool size limit', ['alias'],
+    multiprocess_mode='livesum')
+pool_connections = Gauge(
+    'movierater_db_pool_connections', 'Open pooled connections',
+    ['alias', 'state'], multiprocess_mode='livesum')
+pool_waiting = Gauge(
+    'movierater_db_pool_waiting', 'Requests waiting for a connection',
+    ['alias'], multiprocess_mode='livesum')
+pool_opened = Gauge(
+    'movierater_db_pool_opened', 'Connections opened by the pools so far',
+    ['alias'], multiprocess_mode='livesum')
+pool_checkouts = Gauge(
+    'movierater_db_pool_checkouts', 'Connections handed out by the pools so far',
+    ['alias'], multiprocess_mode='livesum')
+# Django's connection_created fires on every checkout from a pool, so reuse
+# comes from the pools' own counts: each checkout either opened a connection
+# or reused one
+pool_reused = Gauge(
+    'movierater_db_pool_reused', 'Checkouts served by an already open connection',
+    ['alias'], multiprocess_mode='livesum')
+
+POOL_INTERVAL = 1.0
+_pool_updated = 0.0
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match.url_name or '<unnamed>'
+
+
+def observe_request(request, response, stats, duration):
+    view = _view_name(request)
+    requests_total.labels(view, request.method, response.status_code).inc()
+    request_duration.labels(view).observe(duration)
+    db_queries.labels(view).observe(stats.queries)
+    db_duration.labels(view).observe(stats.db_time)
+    update_pool_gauges()
+
+
+def update_pool_gauges():
+    """Copy the pool stats into gauges, at most once per POOL_INTERVAL."""
+    global _pool_updated
+    now = time.monotonic()
+    if now - _pool_updated < POOL_INTERVAL:
+        return
+    _pool_updated = now
+    for alias, pool in db_pool.stats().items():
+        pool_max.labels(alias).set(pool['max'])
+        pool_connections.labels(alias, 'idle').set(pool['idle'])
+        pool_connections.labels(alias, 'in_use').set(pool['size'] - pool['idle'])
+        pool_waiting.labels(alias).set(pool['waiting'])
+        pool_opened.labels(alias).set(pool['opened'])
+        pool_checkouts.labels(alias).set(pool['checkouts'])
+        pool_reused.labels(alias).set(max(0, pool['checkouts'] - pool['opened']))
+
+
+def cache_lookup(cache, hit):
+    cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _authorized(request):
+    token = settings.METRICS_AUTH_TOKEN
+    if not token:
+        # without a token the endpoint is only served in development
+        return settings.DEBUG
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header, f'Bearer {token}')
+
+
+def metrics_view(request):
+    """Prometheus text exposition of all metrics."""
+    if not _authorized(request):
+        raise Http404
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,142 @@
+"""
+Request timing and read-replica middleware.
+
+Adds a Server-Timing header to every response and logs one structured
+line per request to the "api.timing" logger:
+
+- db: time spent in SQL and the number of queries
+- view: the view up to its response, without serialization
+- serialize: building serializer output (.data) for list/detail reads
+- render: rendering the response body (e.g. JSON encoding)
+- total: the whole request as seen by this middleware
+
+Requests slower than SLOW_REQUEST_THRESHOLD_MS are also logged as a
+warning with a sample of their slowest SQL statements. The same numbers
+feed the Prometheus metrics in api.metrics.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from movierater import database_router
+
+from . import metrics, timing
+
+logger = logging.getLogger('api.timing')
+
+
+class RequestTimingMiddleware:
+    # works under WSGI and ASGI without switching modes for the stack
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.SLOW_REQUEST_THRESHOLD_MS / 1000
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token = timing.start()
+        started = time.perf_counter()
+        request._timing_view_done = None
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token = timing.start()
+        started = time.perf_counter()
+        request._timing_view_done = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        total = time.perf_counter() - started
+        view_done = request._timing_view_done
+        view = (view_done or time.perf_counter()) - started
+        render = total - view if view_done else 0.0
+        serialize = stats.serialize_time
+        view -= serialize
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'view;dur={view * 1000:.1f}',
+            f'serialize;dur={serialize * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        self.log(request, response, stats, total, view, serialize, render)
+        metrics.observe_request(request, response, stats, total)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook, which splits view
+        # time from render time
+        request._timing_view_done = time.perf_counter()
+        return response
+
+    def log(self, request, response, stats, total, view, serialize, render):
+        slow = total >= self.threshold
+        if not (slow or logger.isEnabledFor(logging.INFO)):
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000, 3),
+            'view_ms': round(view * 1000, 3),
+            'serialize_ms': round(serialize * 1000, 3),
+            'render_ms': round(render * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+        }
+        if slow:
+            record['slow_queries'] = stats.slow_queries()
+            logger.warning('slow request %s', json.dumps(record))
+        else:
+            logger.info('request %s', json.dumps(record))
+
+
+class ReadReplicaMiddleware:
+    """
+    Start every request unpinned from the primary database.
+
+    Authentication pins the request when its user wrote recently (see
+    movierater.database_router); this clears the flag again afterwards so
+    it never leaks into the next request served by the same thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = database_router.begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            database_router.end_request(token)
+
+    async def __acall__(self, request):
+        token = database_router.begin_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            database_router.end_request(token)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:20
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    Rating = apps.get_model('api', 'Rating')
+    totals = (Rating.objects.values('movie')
+              .annotate(n=Count('id'), s=Sum('stars')).order_by())
+    for row in totals:
+        Movie.objects.filter(id=row['movie']).update(
+            rating_count=row['n'], rating_sum=row['s'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_add_schema_table_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates,
+                             migrations.RunPython.noop),
+    ]
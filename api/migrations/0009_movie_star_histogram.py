@@ -0,0 +1,51 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_star_histogram(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    Rating = apps.get_model('api', 'Rating')
+    buckets = (Rating.objects.values('movie', 'stars')
+               .annotate(n=Count('id')).order_by())
+    for row in buckets:
+        Movie.objects.filter(id=row['movie']).update(
+            **{f"stars_{row['stars']}": row['n']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_movie_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_star_histogram,
+                             migrations.RunPython.noop),
+    ]
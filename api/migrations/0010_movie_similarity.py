@@ -0,0 +1,30 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_movie_star_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='api.movie')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+            ],
+            options={
+                'verbose_name': 'Movie similarity',
+                'verbose_name_plural': 'Movie similarities',
+                'db_table': 'movie_rater_api.movie_similarity',
+                'indexes': [models.Index(fields=['movie', '-score'], name='idx_movie_similarity_score')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'similar'), name='unique_movie_similar')],
+            },
+        ),
+    ]
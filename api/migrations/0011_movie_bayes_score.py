@@ -0,0 +1,34 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Value
+
+
+def backfill_bayes_score(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    weight = float(settings.RATING_PRIOR_WEIGHT)
+    prior = weight * settings.RATING_PRIOR_MEAN
+    Movie.objects.filter(rating_count__gt=0).update(
+        bayes_score=(Value(prior) + F('rating_sum')) / (Value(weight) + F('rating_count')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_movie_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='bayes_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-bayes_score', 'id'], name='idx_movie_bayes_rank'),
+        ),
+        migrations.RunPython(backfill_bayes_score,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_movie_bayes_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('kind', models.CharField(max_length=20)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Import checkpoint',
+                'verbose_name_plural': 'Import checkpoints',
+                'db_table': 'movie_rater_api.import_checkpoint',
+                'constraints': [models.UniqueConstraint(fields=('source', 'kind'), name='unique_import_checkpoint')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExternalMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('external_id', models.CharField(max_length=64)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_ids', to='api.movie')),
+            ],
+            options={
+                'verbose_name': 'External movie id',
+                'verbose_name_plural': 'External movie ids',
+                'db_table': 'movie_rater_api.external_movie',
+                'constraints': [models.UniqueConstraint(fields=('source', 'external_id'), name='unique_source_external_id')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.13 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_import_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='image_sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
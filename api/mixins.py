@@ -0,0 +1,126 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from movierater import database_router
+
+from . import cache as versions, metrics, timing
+
+
+class CachedResponseMixin:
+    """
+    Serve list and retrieve responses from Django's cache.
+
+    Entries are keyed by the collection or movie version from api.cache, so
+    a write makes the next read miss without deleting anything. A hit only
+    needs the version lookup and the cached data, not the database.
+
+    The same key yields a strong ETag and the version a Last-Modified time,
+    so a conditional GET that still matches gets 304 Not Modified before
+    anything is serialized.
+    """
+    cache_prefix = 'api:movies'
+
+    def cache_parts(self):
+        """Extra key parts for responses that differ per user."""
+        return ()
+
+    def list(self, request, *args, **kwargs):
+        version = versions.collection_version()
+        key = versions.response_key(f'{self.cache_prefix}:list', request, version,
+                                    *self.cache_parts())
+        return self._cached(key, version, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+        version = versions.movie_version(pk, create=False)
+        if version is None:
+            # version keys never expire, so one is only made for a movie
+            # that was found; this response goes out uncached
+            with database_router.use_primary():
+                response = super().retrieve(request, *args, **kwargs)
+            if response.status_code == 200:
+                versions.movie_version(pk)
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        key = versions.response_key(f'{self.cache_prefix}:detail', request,
+                                    version, pk, *self.cache_parts())
+        return self._cached(key, version, super().retrieve, request, *args, **kwargs)
+
+    def _cached(self, key, version, view, request, *args, **kwargs):
+        etag = '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+        last_modified = version // 1_000_000_000
+
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            data = cache.get(key)
+            metrics.cache_lookup('response', data is not None)
+            if data is not None:
+                response = Response(data)
+            else:
+                # the entry is stored under the current version, so build it
+                # from the primary rather than a replica that may lag behind
+                with database_router.use_primary():
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, versions.timeout())
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # authenticated data: let clients keep it but revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ValuesReadMixin:
+    """
+    Serve list and retrieve from `.values()` rows.
+
+    values_serializers maps the view's serializer class to its
+    ValuesSerializer twin. For the values_actions the queryset loads only the
+    columns the output needs, as dicts, and the twin turns them into the
+    same JSON the model serializer would, without building model instances.
+    Every other use of get_serializer (writes, browsable API forms) still
+    gets the model serializer.
+    """
+    values_serializers = {}
+    values_actions = ('list', 'retrieve')
+
+    def values_serializer_class(self):
+        if self.action in self.values_actions:
+            return self.values_serializers.get(self.get_serializer_class())
+        return None
+
+    def field_kwargs(self):
+        """Extra serializer kwargs such as fields=/exclude=."""
+        return {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        values_class = self.values_serializer_class()
+        if values_class is not None:
+            columns = values_class(**self.field_kwargs()).columns()
+            queryset = queryset.values(*columns)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.field_kwargs())
+        values_class = self.values_serializer_class()
+        instance = args[0] if args else kwargs.get('instance')
+        if values_class is not None and instance is not None:
+            serializer = values_class(*args, **kwargs)
+        else:
+            serializer = super().get_serializer(*args, **kwargs)
+        if instance is not None and 'data' not in kwargs:
+            # output only: time it apart from the rest of the view
+            timing.serialize(serializer)
+        return serializer
@@ -8,36 +8,63 @@ env = environ.Env()
 
 # Create your models here.
 
+# Movie columns written only by the F() updates in api.aggregates
+AGGREGATE_FIELDS = ('rating_count', 'rating_sum', 'stars_1', 'stars_2', 'stars_3',
+                    'stars_4', 'stars_5', 'bayes_score')
+
 
 class Movie(models.Model):
     title = models.CharField(max_length=150)
     description = models.TextField(max_length=360)
     imagePath = models.URLField(max_length=200, blank=True, null=True)
+    # denormalized rating aggregates, maintained by api.aggregates
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # number of 1 to 5 star votes, one column per bucket
+    stars_1 = models.PositiveIntegerField(default=0, editable=False)
+    stars_2 = models.PositiveIntegerField(default=0, editable=False)
+    stars_3 = models.PositiveIntegerField(default=0, editable=False)
+    stars_4 = models.PositiveIntegerField(default=0, editable=False)
+    stars_5 = models.PositiveIntegerField(default=0, editable=False)
+    # damped (Bayesian) average used to rank movies; 0 while unrated
+    bayes_score = models.FloatField(default=0, editable=False)
+    # SHA-256 of the uploaded poster (see api.images); blank for linked images
+    image_sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
     
     class Meta:
         # Specify schema for multi-tenant Azure SQL Database
         db_table = f"{env('AZURE_SQL_SCHEMA', default='movie_rater_api')}.movie"
         verbose_name = "Movie"
         verbose_name_plural = "Movies"
+        indexes = [
+            models.Index(fields=['-bayes_score', 'id'], name='idx_movie_bayes_rank')
+        ]
+
+    def save(self, *args, **kwargs):
+        # an instance loaded before the latest votes would write their
+        # aggregates back to what it read, so updates leave them alone
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in AGGREGATE_FIELDS]
+        super().save(*args, **kwargs)
 
     # count the number of ratings for the movie
     def no_of_ratings(self):
-        ratings = Rating.objects.filter(movie=self)
-        return len(ratings)
-
+        return self.rating_count
 
     # sum ratings and divide by number of ratings
     def ave_ratings(self):
-        total = 0
-        ratings = Rating.objects.filter(movie=self)
-        for rating in ratings:
-            total += rating.stars
-        
-        if len(ratings) > 0:
-            return total / len(ratings)
+        if self.rating_count > 0:
+            return self.rating_sum / self.rating_count
         else:
             return 0
 
+    # distribution of votes keyed by number of stars
+    def ratings_histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
 
 class Rating(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
@@ -59,3 +86,60 @@ class Rating(models.Model):
         indexes = [
             models.Index(fields=['user', 'movie'], name='idx_user_movie_rating')
         ]
+
+
+class MovieSimilarity(models.Model):
+    # precomputed nearest neighbours, rebuilt by `manage.py build_similar_movies`
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE,
+                              related_name='similarities')
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE,
+                                related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        # Specify schema for multi-tenant Azure SQL Database
+        db_table = f"{env('AZURE_SQL_SCHEMA', default='movie_rater_api')}.movie_similarity"
+        verbose_name = "Movie similarity"
+        verbose_name_plural = "Movie similarities"
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'similar'], name='unique_movie_similar')
+        ]
+        indexes = [
+            models.Index(fields=['movie', '-score'], name='idx_movie_similarity_score')
+        ]
+
+
+class ExternalMovie(models.Model):
+    # maps a movie id from an imported dataset (e.g. MovieLens) to our movie
+    source = models.CharField(max_length=50)
+    external_id = models.CharField(max_length=64)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE,
+                              related_name='external_ids')
+
+    class Meta:
+        # Specify schema for multi-tenant Azure SQL Database
+        db_table = f"{env('AZURE_SQL_SCHEMA', default='movie_rater_api')}.external_movie"
+        verbose_name = "External movie id"
+        verbose_name_plural = "External movie ids"
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'external_id'], name='unique_source_external_id')
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    # how far an import got through a file, committed with each batch
+    source = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20)
+    offset = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Specify schema for multi-tenant Azure SQL Database
+        db_table = f"{env('AZURE_SQL_SCHEMA', default='movie_rater_api')}.import_checkpoint"
+        verbose_name = "Import checkpoint"
+        verbose_name_plural = "Import checkpoints"
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'kind'], name='unique_import_checkpoint')
+        ]
@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MovieCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the movie primary key.
+
+    The cursor is an opaque token encoding the last id seen, so every page
+    is an indexed range scan no matter how deep the client has paged.
+    """
+    ordering = ('id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class RatingCursorPagination(CursorPagination):
+    """Keyset pagination over the rating primary key."""
+    ordering = ('id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class UserRatingCursorPagination(RatingCursorPagination):
+    """
+    Keyset pagination over one user's ratings by movie id.
+
+    A user rates each movie once, so the movie id is unique among their
+    ratings and the (user, movie) index serves every page.
+    """
+    ordering = ('movie_id',)
@@ -0,0 +1,115 @@
+"""
+Item-item "similar movies" model built from the Rating table.
+
+Ratings are loaded into a sparse user x movie matrix. The similarity
+between two movies is the cosine of their rating columns. With the default
+adjusted cosine, each user's mean rating is subtracted first, so generous
+and harsh raters count equally. The similarity matrix is computed one block
+of movie columns at a time with sparse matrix products. Only the top K
+neighbours of each movie are kept and stored in MovieSimilarity, so a
+request for similar movies is a single indexed lookup.
+
+NumPy and SciPy are only needed to build the model, not to serve it.
+"""
+from array import array
+
+import numpy as np
+from scipy import sparse
+from django.db import router, transaction
+
+from .models import MovieSimilarity, Rating
+
+
+def load_ratings(chunk_size=50000):
+    """Stream (user, movie, stars) triples into three NumPy arrays."""
+    users, movies, stars = array('q'), array('q'), array('b')
+    rows = (Rating.objects.order_by()
+            .values_list('user_id', 'movie_id', 'stars')
+            .iterator(chunk_size=chunk_size))
+    for user_id, movie_id, value in rows:
+        users.append(user_id)
+        movies.append(movie_id)
+        stars.append(value)
+    return (np.frombuffer(users, dtype=np.int64),
+            np.frombuffer(movies, dtype=np.int64),
+            np.frombuffer(stars, dtype=np.int8))
+
+
+def rating_matrix(users, movies, stars, adjusted=True):
+    """
+    Build the normalized users x movies matrix.
+
+    Returns the CSC matrix and the movie ids of its columns. Every column
+    has unit length, so a column dot product is a cosine similarity.
+    """
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    movie_ids, movie_index = np.unique(movies, return_inverse=True)
+    values = stars.astype(np.float32)
+
+    if adjusted:
+        counts = np.bincount(user_index, minlength=len(user_ids))
+        totals = np.bincount(user_index, weights=values, minlength=len(user_ids))
+        values = values - (totals / counts)[user_index].astype(np.float32)
+
+    matrix = sparse.csc_matrix((values, (user_index, movie_index)),
+                               shape=(len(user_ids), len(movie_ids)),
+                               dtype=np.float32)
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1
+    matrix = matrix @ sparse.diags(1 / norms).astype(np.float32)
+    return matrix.tocsc(), movie_ids
+
+
+def top_neighbours(matrix, neighbours=20, block_size=256):
+    """
+    Yield (column, neighbour columns, scores) for every movie column.
+
+    Similarities are computed for block_size columns at a time, which keeps
+    memory at about movies x block_size floats. Only positive scores are
+    kept.
+    """
+    transposed = matrix.T.tocsr()
+    n_movies = matrix.shape[1]
+    k = min(neighbours, n_movies - 1)
+    if k <= 0:
+        return
+
+    for start in range(0, n_movies, block_size):
+        stop = min(start + block_size, n_movies)
+        block = (transposed @ matrix[:, start:stop]).toarray()
+        # a movie is not its own neighbour
+        block[np.arange(start, stop), np.arange(stop - start)] = -np.inf
+
+        candidates = np.argpartition(-block, k - 1, axis=0)[:k]
+        scores = np.take_along_axis(block, candidates, axis=0)
+        order = np.argsort(-scores, axis=0)
+        candidates = np.take_along_axis(candidates, order, axis=0)
+        scores = np.take_along_axis(scores, order, axis=0)
+
+        for offset in range(stop - start):
+            keep = scores[:, offset] > 0
+            yield start + offset, candidates[keep, offset], scores[keep, offset]
+
+
+def build(neighbours=20, block_size=256, adjusted=True, batch_size=5000):
+    """
+    Recompute every movie's neighbours and replace the stored table.
+
+    Returns the number of similarity rows written.
+    """
+    matrix, movie_ids = rating_matrix(*load_ratings(), adjusted=adjusted)
+
+    rows = []
+    for column, similar, scores in top_neighbours(matrix, neighbours, block_size):
+        movie_id = int(movie_ids[column])
+        rows.extend(
+            MovieSimilarity(movie_id=movie_id, similar_id=int(similar_id),
+                            score=float(score))
+            for similar_id, score in zip(movie_ids[similar], scores))
+
+    with transaction.atomic(using=router.db_for_write(MovieSimilarity)):
+        MovieSimilarity.objects.all().delete()
+        MovieSimilarity.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
@@ -0,0 +1,57 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _default(obj):
+    # whatever orjson and msgpack can't encode natively (Decimal, lazy
+    # strings, querysets...) goes through DRF's JSON encoder rules
+    return JSONEncoder().default(obj)
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Accept any media type for views that build their own HttpResponse,
+    such as streaming exports, so content negotiation never rejects them.
+
+    Put it after a real renderer: data that still reaches it, such as an
+    error for a client that only accepts CSV, is written as JSON.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, bytes):
+            return data
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson, several times faster on large lists.
+
+    Output matches JSONRenderer's compact form; an `indent` in the Accept
+    header (or the browsable API) still gets indented JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack responses for `Accept: application/msgpack` or ?format=msgpack."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
@@ -1,91 +1,56 @@
 """
 S3 utilities for generating presigned upload URLs
 """
-import os
-import boto3
-from botocore.exceptions import ClientError
+import uuid
+from pathlib import Path
 
+from django.conf import settings
 
-def generate_presigned_upload_url(file_name, file_type='image/jpeg', expiration=3600, max_size_mb=5, file_hash=None):
+from . import storage
+from .images import CONTENT_TYPES, SHA256
+
+
+def generate_presigned_upload_url(file_name, file_type='image/jpeg', file_hash=None):
     """
     Generate a presigned S3 URL for direct file upload from frontend.
-    
+
+    The URL is valid for AWS_PRESIGNED_EXPIRY seconds; bucket and region
+    come from settings (see api.storage).
+
     Args:
         file_name: Original filename from frontend (will be sanitized)
         file_type: MIME type of the file (default: image/jpeg)
-        expiration: URL expiration time in seconds (default: 1 hour)
-        max_size_mb: Maximum file size in MB (default: 5 MB)
         file_hash: Optional SHA256 hash of file content for deduplication
-    
+
     Returns:
-        dict with 'url' (presigned URL), 'key' (S3 object key), and 'public_url' (final image URL)
+        dict with 'upload_url' (presigned URL), 'key' (S3 object key),
+        'public_url' (final image URL), 'method' and 'headers'
     """
-    # Get AWS credentials from environment
-    aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-    aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-    bucket_name = 'movie-rater'
-    region = 'eu-west-1'  # Change if your bucket is in a different region
-    
-    if not (aws_access_key and aws_secret_key):
-        raise ValueError("AWS credentials not configured")
-    
-    # Sanitize filename and create S3 key
-    import uuid
-    from pathlib import Path
-    
+    if not storage.configured():
+        raise ValueError("Object storage not configured (set AWS_STORAGE_BUCKET_NAME)")
+
     # Generate filename based on content hash (for deduplication) or UUID (for uniqueness)
-    ext = Path(file_name).suffix or '.jpg'
-    
-    if file_hash:
-        # Use hash-based filename for automatic deduplication
-        # Same image = same hash = same filename = overwrites duplicate
-        safe_name = f"movie-{file_hash[:16]}{ext}"
+    ext = Path(file_name).suffix.lower().lstrip('.')
+    if ext == 'jpeg' or ext not in CONTENT_TYPES:
+        ext = 'jpg'
+
+    if file_hash and SHA256.fullmatch(file_hash):
+        # Same image = same hash = same key, and the presigned URL for it
+        # is reused until shortly before it expires
+        s3_key = storage.poster_key(file_hash, ext)
+        reuse = True
     else:
         # Fall back to UUID for unique filenames (legacy behavior)
-        unique_id = uuid.uuid4().hex[:8]
-        safe_name = f"movie-{unique_id}{ext}"
-    
-    s3_key = f"media/movies/{safe_name}"
-    
-    # Calculate max size in bytes
-    max_size_bytes = max_size_mb * 1024 * 1024
-    
-    try:
-        # Create S3 client
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=region
-        )
-        
-        # Generate presigned POST URL with size limit
-        response = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': s3_key,
-                'ContentType': file_type,
-                'ACL': 'public-read',  # Make uploaded images publicly readable
-                'ContentLength': max_size_bytes  # Enforce max file size
-            },
-            ExpiresIn=expiration
-        )
-        
-        # Construct the public URL that will be accessible after upload
-        public_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
-        
-        return {
-            'upload_url': response,
-            'key': s3_key,
-            'public_url': public_url,
-            'method': 'PUT',
-            'headers': {
-                'Content-Type': file_type,
-                'x-amz-acl': 'public-read',
-                'Content-Length': str(max_size_bytes)
-            }
-        }
-        
-    except ClientError as e:
-        raise Exception(f"Failed to generate presigned URL: {str(e)}")
+        s3_key = f"media/movies/movie-{uuid.uuid4().hex[:8]}.{ext}"
+        reuse = False
+
+    headers = {'Content-Type': file_type}
+    if settings.AWS_DEFAULT_ACL:
+        headers['x-amz-acl'] = settings.AWS_DEFAULT_ACL
+    return {
+        'upload_url': storage.presigned_upload(s3_key, file_type, reuse=reuse),
+        'key': s3_key,
+        'public_url': storage.public_url(s3_key),
+        'method': 'PUT',
+        'headers': headers,
+    }
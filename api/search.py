@@ -0,0 +1,182 @@
+"""
+Full-text search over movie titles and descriptions.
+
+Each database gets its own index and query:
+
+- PostgreSQL: a generated, weighted tsvector column with a GIN index.
+- SQLite: an FTS5 external-content table kept in sync by triggers.
+- SQL Server: a full-text index with automatic change tracking.
+- Anything else falls back to icontains filters.
+
+The database keeps every index in sync on Movie writes, including bulk
+loads that skip Django signals. install() creates whatever is missing and
+is safe to run repeatedly. It runs after every `migrate`, which also
+restores the SQLite triggers if a migration rebuilt the movie table.
+
+Queries are split into word terms and every term must match, either as a
+whole word or as a prefix, so "star wa" finds "Star Wars". Results come
+back best match first, with titles weighted above descriptions.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Movie
+
+FTS_TABLE = 'movie_fts'
+PG_COLUMN = 'search_vector'
+PG_INDEX = 'movie_search_vector_idx'
+MSSQL_CATALOG = 'movierater_catalog'
+
+TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(query):
+    """Split a free-text query into safe word terms."""
+    return TERM.findall(query.lower())[:10]
+
+
+def _table(connection):
+    return connection.ops.quote_name(Movie._meta.db_table)
+
+
+# -- index setup ----------------------------------------------------------
+
+def _install_postgresql(connection, cursor):
+    table = _table(connection)
+    cursor.execute(
+        'SELECT 1 FROM information_schema.columns '
+        'WHERE table_name = %s AND column_name = %s',
+        [Movie._meta.db_table, PG_COLUMN])
+    if cursor.fetchone() is None:
+        cursor.execute(
+            f"ALTER TABLE {table} ADD COLUMN {PG_COLUMN} tsvector "
+            f"GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+            f") STORED")
+    cursor.execute(
+        f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {table} USING GIN ({PG_COLUMN})')
+
+
+def _install_sqlite(connection, cursor):
+    table = _table(connection)
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"title, description, content={table}, content_rowid='id', "
+        f"tokenize='porter unicode61')")
+
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+                   "AND name LIKE %s", [f'{FTS_TABLE}_%'])
+    if cursor.fetchone()[0] == 3:
+        return
+    # triggers are missing (new install, or the table was rebuilt)
+    cursor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description) "
+        f"VALUES (new.id, new.title, new.description); END")
+    cursor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+        f"VALUES ('delete', old.id, old.title, old.description); END")
+    cursor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update "
+        f"AFTER UPDATE OF title, description ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+        f"VALUES ('delete', old.id, old.title, old.description); "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description) "
+        f"VALUES (new.id, new.title, new.description); END")
+    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def _install_mssql(connection, cursor):
+    table = _table(connection)
+    cursor.execute(
+        f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{MSSQL_CATALOG}') "
+        f"CREATE FULLTEXT CATALOG {MSSQL_CATALOG}")
+    cursor.execute('SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)',
+                   [table])
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute('SELECT name FROM sys.indexes '
+                   'WHERE object_id = OBJECT_ID(%s) AND is_primary_key = 1', [table])
+    key_index = cursor.fetchone()[0]
+    cursor.execute(
+        f"CREATE FULLTEXT INDEX ON {table} (title, description) "
+        f"KEY INDEX [{key_index}] ON {MSSQL_CATALOG} WITH CHANGE_TRACKING AUTO")
+
+
+INSTALLERS = {
+    'postgresql': _install_postgresql,
+    'sqlite': _install_sqlite,
+    'microsoft': _install_mssql,
+}
+
+
+def install(using=None):
+    """Create the full-text index for the database if it is missing."""
+    using = using or router.db_for_write(Movie)
+    connection = connections[using]
+    installer = INSTALLERS.get(connection.vendor)
+    if (installer is None or Movie._meta.db_table
+            not in connection.introspection.table_names()):
+        return False
+    with connection.cursor() as cursor:
+        installer(connection, cursor)
+    return True
+
+
+# -- queries --------------------------------------------------------------
+
+def _search_postgresql(connection, cursor, words, limit):
+    query = ' & '.join(f'{word}:*' for word in words)
+    cursor.execute(
+        f"SELECT id FROM {_table(connection)}, to_tsquery('english', %s) tsq "
+        f"WHERE {PG_COLUMN} @@ tsq "
+        f"ORDER BY ts_rank({PG_COLUMN}, tsq) DESC, id LIMIT %s",
+        [query, limit])
+
+
+def _search_sqlite(connection, cursor, words, limit):
+    query = ' '.join(f'"{word}"*' for word in words)
+    # bm25() is lower for better matches; weight titles over descriptions
+    cursor.execute(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), rowid LIMIT %s",
+        [query, limit])
+
+
+def _search_mssql(connection, cursor, words, limit):
+    table = _table(connection)
+    query = ' AND '.join(f'"{word}*"' for word in words)
+    cursor.execute(
+        f"SELECT TOP (%s) ft.[KEY] FROM CONTAINSTABLE({table}, (title, description), %s) ft "
+        f"ORDER BY ft.[RANK] DESC, ft.[KEY]",
+        [limit, query])
+
+
+SEARCHES = {
+    'postgresql': _search_postgresql,
+    'sqlite': _search_sqlite,
+    'microsoft': _search_mssql,
+}
+
+
+def search(query, limit=50, using=None):
+    """Ids of the movies matching a free-text query, best match first."""
+    words = terms(query)
+    if not words:
+        return []
+    using = using or router.db_for_read(Movie)
+    connection = connections[using]
+    run = SEARCHES.get(connection.vendor)
+    if run is None:
+        matches = Movie.objects.using(using)
+        for word in words:
+            matches = matches.filter(Q(title__icontains=word)
+                                     | Q(description__icontains=word))
+        return list(matches.order_by('id').values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        run(connection, cursor, words, limit)
+        return [row[0] for row in cursor.fetchall()]
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from . import images
 from .models import Movie, Rating
 from rest_framework.authtoken.models import Token
 
@@ -19,7 +21,36 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Let a serializer be narrowed to some of its fields.
+
+    Pass fields= (names to keep) and/or exclude= (names to drop). Method
+    fields declare the model columns they read in column_map, so reads can
+    load just the columns the remaining fields need (see ValuesSerializer).
+    """
+    column_map = {}
+
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
+
+
+class MovieSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # the rating fields are methods over the stored aggregates
+    column_map = {
+        'no_of_ratings': ('rating_count',),
+        'ave_ratings': ('rating_count', 'rating_sum'),
+        'ratings_histogram': ('stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5'),
+        'thumbnail': ('image_sha256',),
+    }
+    ratings_histogram = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+
     class Meta:
         model = Movie
         fields = (
@@ -27,12 +58,155 @@ class MovieSerializer(serializers.ModelSerializer):
             'title',
             'description',
             'imagePath',
+            'thumbnail',
+            'no_of_ratings',
+            'ave_ratings',
+            'ratings_histogram',
+            )
+
+    def __init__(self, *args, my_rating=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        if my_rating:
+            # the caller's own stars, from my_rating_prefetch(user)
+            self.fields['my_rating'] = serializers.SerializerMethodField()
+
+    def get_ratings_histogram(self, movie):
+        # string keys, as JSON would make them, so MessagePack clients get
+        # the same map
+        return {str(stars): count for stars, count in movie.ratings_histogram().items()}
+
+    def get_thumbnail(self, movie):
+        # uploaded posters only; linked images have no thumbnails
+        if not movie.image_sha256:
+            return None
+        return images.thumbnail_url(movie.image_sha256)
+
+    def get_my_rating(self, movie):
+        ratings = getattr(movie, 'my_ratings', None)
+        return ratings[0].stars if ratings else None
+
+
+def my_rating_prefetch(user):
+    """
+    Prefetch the user's rating of each movie into movie.my_ratings.
+
+    One query over the (user, movie) index for all the movies, instead of
+    one per movie.
+    """
+    return Prefetch('rating_set', queryset=Rating.objects.filter(user=user).only(
+        'id', 'movie_id', 'stars'), to_attr='my_ratings')
+
+
+def my_ratings(user, movie_ids):
+    """{movie id: stars} of the user's ratings of the given movies."""
+    return dict(Rating.objects.filter(user=user, movie_id__in=movie_ids)
+                .values_list('movie_id', 'stars'))
+
+
+class MovieCompactSerializer(MovieSerializer):
+    """Movie list entries without the description and histogram."""
+
+    class Meta(MovieSerializer.Meta):
+        fields = (
+            'id',
+            'title',
+            'imagePath',
+            'thumbnail',
             'no_of_ratings',
-            'ave_ratings'
+            'ave_ratings',
             )
 
 
 class RatingSerializer(serializers.ModelSerializer):
+    # related fields are output as ids, read from the *_id columns
+    column_map = {'user': ('user_id',), 'movie': ('movie_id',)}
+
     class Meta:
         model = Rating
         fields = ('id', 'stars', 'user', 'movie')
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer over `.values()` rows.
+
+    Gives the same output as serializer_class for list and detail reads,
+    but from plain dicts: no model instances and no per-field objects,
+    just one getter per output field. Supports fields=/exclude= like
+    SparseFieldsMixin; columns() lists the values() columns to load.
+    """
+    serializer_class = None
+
+    def __init__(self, instance=None, many=False, fields=None, exclude=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        names = self.serializer_class.Meta.fields
+        if fields is not None:
+            names = [name for name in names if name in fields]
+        self.field_names = [name for name in names if name not in (exclude or ())]
+        self.getters = [(name, self.getter(name)) for name in self.field_names]
+
+    def getter(self, name):
+        column = self.serializer_class.column_map.get(name, (name,))[0]
+        return lambda row: row[column]
+
+    def columns(self):
+        columns = {'id'}
+        for name in self.field_names:
+            columns.update(self.serializer_class.column_map.get(name, (name,)))
+        return sorted(columns)
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.getters}
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(row) for row in self.instance]
+        return self.to_representation(self.instance)
+
+
+def _ave_ratings(row):
+    count = row['rating_count']
+    return row['rating_sum'] / count if count > 0 else 0
+
+
+def _ratings_histogram(row):
+    return {str(stars): row[f'stars_{stars}'] for stars in range(1, 6)}
+
+
+def _thumbnail(row):
+    sha256 = row['image_sha256']
+    return images.thumbnail_url(sha256) if sha256 else None
+
+
+class MovieValuesSerializer(ValuesSerializer):
+    """
+    Movies from `.values()` rows.
+
+    Pass my_ratings={movie id: stars} (see my_ratings()) to add the
+    caller's own rating as my_rating, null where they haven't rated.
+    """
+    serializer_class = MovieSerializer
+
+    def __init__(self, *args, my_ratings=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if my_ratings is not None:
+            self.getters.append(('my_rating', lambda row: my_ratings.get(row['id'])))
+
+    def getter(self, name):
+        if name == 'ave_ratings':
+            return _ave_ratings
+        if name == 'ratings_histogram':
+            return _ratings_histogram
+        if name == 'thumbnail':
+            return _thumbnail
+        return super().getter(name)
+
+
+class MovieCompactValuesSerializer(MovieValuesSerializer):
+    serializer_class = MovieCompactSerializer
+
+
+class RatingValuesSerializer(ValuesSerializer):
+    serializer_class = RatingSerializer
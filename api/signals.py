@@ -0,0 +1,59 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import aggregates, cache, timing
+from .authentication import forget_tokens
+from .models import Movie, Rating
+
+
+def _deleting(origin, model):
+    return isinstance(origin, model) or (
+        isinstance(origin, QuerySet) and origin.model is model)
+
+
+# keep the movie aggregates in step when ratings are removed through the API
+# or the admin. Cascades are handled in bulk: a deleted movie takes its
+# aggregates with it, and a deleted user's votes are taken back in one go
+# by user_deleting below
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, origin=None, **kwargs):
+    if _deleting(origin, Movie) or _deleting(origin, User):
+        return
+    aggregates.apply_vote(instance.movie_id, old_stars=instance.stars)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    votes = Rating.objects.filter(user=instance).values_list('movie_id', 'stars')
+    aggregates.apply_votes((movie_id, stars, None) for movie_id, stars in votes)
+
+
+# invalidate cached movie responses whenever a movie row changes
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    cache.bump([instance.pk])
+
+
+# drop cached token lookups when a token goes away
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+# and when its user changes, e.g. is deactivated or changes password
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    if not created:
+        forget_tokens(Token.objects.filter(user=instance)
+                      .values_list('key', flat=True))
+
+
+# time SQL on every connection for RequestTimingMiddleware
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    timing.install(connection)
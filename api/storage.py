@@ -0,0 +1,182 @@
+"""
+S3-compatible object storage for movie posters.
+
+Used when AWS_STORAGE_BUCKET_NAME is set. Bucket, region and endpoint come
+from settings, so the same code runs against AWS, MinIO or moto's server
+(AWS_S3_ENDPOINT_URL).
+
+Each process builds one boto3 client, on first use, and shares it between
+threads: boto3 clients are thread-safe and building one takes tens of
+milliseconds. Presigned upload URLs for content-addressed keys are cached
+until AWS_PRESIGNED_MIN_TTL before they expire, so asking again for the
+same image costs a cache lookup. upload() sends files above
+AWS_MULTIPART_THRESHOLD as a multipart upload.
+
+boto3 is only imported once storage is used.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import metrics
+
+_client = None
+_client_lock = threading.Lock()
+
+POSTER_HASH = re.compile(r'[0-9a-f]{64}')
+
+
+class StorageError(Exception):
+    pass
+
+
+def configured():
+    return bool(settings.AWS_STORAGE_BUCKET_NAME)
+
+
+def client():
+    """The process-wide S3 client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                from botocore.config import Config
+
+                # a session of our own: the default one is not thread-safe
+                _client = boto3.session.Session().client(
+                    's3',
+                    region_name=settings.AWS_S3_REGION_NAME,
+                    endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                    config=Config(signature_version='s3v4',
+                                  retries={'mode': 'standard'}),
+                )
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client
+    if setting.startswith('AWS_'):
+        with _client_lock:
+            _client = None
+
+
+def poster_key(sha256, extension):
+    """Object key of a poster, named by its content hash."""
+    return f'media/movies/{sha256}.{extension}'
+
+
+def poster_sha256(url):
+    """The content hash in the public URL of a poster key, or None."""
+    prefix = public_url('media/movies/')
+    if not url.startswith(prefix):
+        return None
+    sha256, _, extension = url[len(prefix):].partition('.')
+    if POSTER_HASH.fullmatch(sha256) and extension.isalpha():
+        return sha256
+    return None
+
+
+def public_url(key):
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    if settings.AWS_S3_ENDPOINT_URL:
+        return f'{settings.AWS_S3_ENDPOINT_URL.rstrip("/")}/{bucket}/{key}'
+    return f'https://{bucket}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{key}'
+
+
+def _acl():
+    return {'ACL': settings.AWS_DEFAULT_ACL} if settings.AWS_DEFAULT_ACL else {}
+
+
+def _not_found(error):
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+def _error(operation, error):
+    return StorageError(f'Storage {operation} failed: {error}')
+
+
+def presigned_upload(key, content_type, reuse=True):
+    """
+    A presigned PUT URL for key, valid for AWS_PRESIGNED_EXPIRY seconds.
+
+    With reuse=True (for content-addressed keys) a URL handed out before is
+    returned again while it has AWS_PRESIGNED_MIN_TTL seconds left.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    cache_key = f'storage:presigned:{settings.AWS_STORAGE_BUCKET_NAME}:{key}:{content_type}'
+    if reuse:
+        url = cache.get(cache_key)
+        metrics.cache_lookup('presigned', url is not None)
+        if url is not None:
+            return url
+    try:
+        url = client().generate_presigned_url(
+            'put_object',
+            Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': key,
+                    'ContentType': content_type, **_acl()},
+            ExpiresIn=settings.AWS_PRESIGNED_EXPIRY,
+        )
+    except (BotoCoreError, ClientError) as error:
+        raise _error('presign', error)
+    lifetime = settings.AWS_PRESIGNED_EXPIRY - settings.AWS_PRESIGNED_MIN_TTL
+    if reuse and lifetime > 0:
+        cache.set(cache_key, url, lifetime)
+    return url
+
+
+def exists(key):
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as error:
+        if _not_found(error):
+            return False
+        raise _error('lookup', error)
+    except BotoCoreError as error:
+        raise _error('lookup', error)
+    return True
+
+
+def download(key, path):
+    """Download key to a local path; False if there is no such object."""
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        client().download_file(settings.AWS_STORAGE_BUCKET_NAME, key, str(path))
+    except ClientError as error:
+        if _not_found(error):
+            return False
+        raise _error('download', error)
+    except BotoCoreError as error:
+        raise _error('download', error)
+    return True
+
+
+def upload(fileobj, key, content_type):
+    """
+    Upload a file object to key.
+
+    Files larger than AWS_MULTIPART_THRESHOLD go up in
+    AWS_MULTIPART_CHUNKSIZE parts, several at a time; a failed multipart
+    upload is aborted rather than left to accumulate storage.
+    """
+    from boto3.exceptions import S3UploadFailedError
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    config = TransferConfig(multipart_threshold=settings.AWS_MULTIPART_THRESHOLD,
+                            multipart_chunksize=settings.AWS_MULTIPART_CHUNKSIZE)
+    try:
+        client().upload_fileobj(
+            fileobj, settings.AWS_STORAGE_BUCKET_NAME, key,
+            ExtraArgs={'ContentType': content_type, **_acl()}, Config=config)
+    except (BotoCoreError, ClientError, S3UploadFailedError) as error:
+        raise _error('upload', error)
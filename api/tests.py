@@ -1,3 +1,659 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+import msgpack
+from moto import mock_aws
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from movierater import db_pool
+
+from . import (async_views, authentication, benchmark, cache as versions, images, importer,
+               metrics, storage, upsert)
+from .models import ImportCheckpoint, Movie, MovieSimilarity, Rating
+
+
+class APITestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='password')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.movie = Movie.objects.create(title='Alien', description='In space')
+        self.other = Movie.objects.create(title='Heat', description='In LA')
+
+    def rate(self, movie, stars):
+        return self.client.post(f'/api/movies/{movie.id}/rate_movie/',
+                                {'stars': stars}, format='json')
+
+    def assertAggregates(self, movie, count, total, histogram):
+        movie.refresh_from_db()
+        self.assertEqual((movie.rating_count, movie.rating_sum), (count, total))
+        self.assertEqual(movie.ratings_histogram(), histogram)
+
+
+class RatingAggregateTests(APITestCase):
+
+    def test_create_counts_the_vote(self):
+        response = self.rate(self.movie, 4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], 'Rating created!')
+        self.assertAggregates(self.movie, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+    def test_update_moves_the_vote(self):
+        self.rate(self.movie, 4)
+        response = self.rate(self.movie, 2)
+        self.assertEqual(response.data['message'], 'Rating Updated!')
+        self.assertAggregates(self.movie, 1, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+
+    def test_delete_takes_the_vote_back(self):
+        self.rate(self.movie, 4)
+        self.rate(self.movie, 5)
+        rating = Rating.objects.get(user=self.user, movie=self.movie)
+        response = self.client.delete(f'/api/ratings/{rating.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertAggregates(self.movie, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+
+    def test_deleting_a_user_takes_their_votes_back(self):
+        self.rate(self.movie, 3)
+        self.rate(self.other, 5)
+        self.user.delete()
+        self.assertAggregates(self.movie, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+        self.assertAggregates(self.other, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+
+    def test_saving_a_movie_keeps_its_aggregates(self):
+        stale = Movie.objects.get(id=self.movie.id)
+        self.rate(self.movie, 5)
+        stale.title = 'Aliens'
+        stale.save()
+        self.assertAggregates(self.movie, 1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+        self.assertEqual(self.movie.title, 'Aliens')
+
+
+class BulkRatingTests(APITestCase):
+
+    def test_statuses(self):
+        self.rate(self.other, 1)
+        response = self.client.post('/api/ratings/bulk/', {'ratings': [
+            {'movie': self.movie.id, 'stars': 3},
+            {'movie': self.other.id, 'stars': 4},
+            {'movie': self.movie.id, 'stars': 5},
+            {'movie': 0, 'stars': 2},
+            {'movie': self.movie.id, 'stars': 9},
+            {'stars': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'],
+                         ['duplicate', 'updated', 'created', 'not_found', 'invalid', 'invalid'])
+        self.assertEqual(
+            (response.data['created'], response.data['updated'], response.data['failed']),
+            (1, 1, 3))
+        self.assertAggregates(self.movie, 1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+        self.assertAggregates(self.other, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+
+    def test_rejects_a_body_without_a_list(self):
+        response = self.client.post('/api/ratings/bulk/', {'movie': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CacheInvalidationTests(APITestCase):
+
+    def test_vote_refreshes_cached_responses(self):
+        detail, listing = f'/api/movies/{self.movie.id}/', '/api/movies/'
+        self.assertEqual(self.client.get(detail).data['no_of_ratings'], 0)
+        self.assertEqual(self.client.get(listing).data['results'][0]['no_of_ratings'], 0)
+
+        # the version bump waits for the commit, which TestCase never reaches
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate(self.movie, 4)
+
+        self.assertEqual(self.client.get(detail).data['no_of_ratings'], 1)
+        self.assertEqual(self.client.get(listing).data['results'][0]['no_of_ratings'], 1)
+
+    def test_unknown_movies_leave_no_version_key(self):
+        for pk in ('abc', '99999999'):
+            self.assertEqual(self.client.get(f'/api/movies/{pk}/').status_code, 404)
+        self.assertIsNone(cache.get(versions._movie_key(99999999)))
+
+        detail = f'/api/movies/{self.movie.id}/'
+        self.assertNotIn('ETag', self.client.get(detail))
+        self.assertIsNotNone(cache.get(versions._movie_key(self.movie.id)))
+        self.assertIn('ETag', self.client.get(detail))
+
+
+class PaginationTests(APITestCase):
+
+    def test_movies_follow_the_next_cursor(self):
+        Movie.objects.create(title='Up', description='Balloons')
+        first = self.client.get('/api/movies/?page_size=2').data
+        self.assertEqual([movie['title'] for movie in first['results']], ['Alien', 'Heat'])
+        self.assertIn('cursor=', first['next'])
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).data
+        self.assertEqual([movie['title'] for movie in second['results']], ['Up'])
+        self.assertIsNone(second['next'])
+
+    def test_ratings_follow_the_next_cursor(self):
+        for movie in (self.movie, self.other):
+            self.rate(movie, 3)
+        first = self.client.get('/api/ratings/?page_size=1').data
+        second = self.client.get(first['next']).data
+        self.assertEqual([first['results'][0]['movie'], second['results'][0]['movie']],
+                         [self.movie.id, self.other.id])
+
+
+class StarsValidationTests(APITestCase):
+
+    def test_rate_movie_rejects_fractions_and_booleans(self):
+        for stars in (4.9, True, '4.5', None):
+            response = self.rate(self.movie, stars)
+            self.assertEqual(response.status_code, 400, stars)
+        self.assertEqual(self.rate(self.movie, '4').status_code, 200)
+        self.assertEqual(self.rate(self.movie, 5.0).status_code, 200)
+        self.assertAggregates(self.movie, 1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+    def test_bulk_marks_fractions_invalid(self):
+        response = self.client.post('/api/ratings/bulk/', [
+            {'movie': self.movie.id, 'stars': 4.9},
+            {'movie': self.other.id, 'stars': False},
+            {'movie': self.other.id + 0.5, 'stars': 3},
+            'not a rating',
+        ], format='json')
+        self.assertEqual(response.data['results'], ['invalid'] * 4)
+        self.assertFalse(Rating.objects.exists())
+
+
+class ConditionalGetTests(APITestCase):
+
+    def test_matching_etag_gets_304(self):
+        response = self.client.get('/api/movies/')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        response = self.client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate(self.movie, 4)
+        response = self.client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TokenCacheTests(APITestCase):
+
+    def test_deactivated_user_is_dropped_from_the_cache(self):
+        self.assertEqual(self.client.get('/api/movies/').status_code, 200)
+        key = authentication.token_cache_key(self.user.auth_token.key)
+        self.assertEqual(cache.get(key), (self.user.id, True, False))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(self.client.get('/api/movies/').status_code, 401)
+
+    def test_deleted_token_is_dropped_from_the_cache(self):
+        self.client.get('/api/movies/')
+        key = self.user.auth_token.key
+        self.user.auth_token.delete()
+        self.assertIsNone(cache.get(authentication.token_cache_key(key)))
+        self.assertEqual(self.client.get('/api/movies/').status_code, 401)
+
+
+class SimilarMoviesTests(APITestCase):
+
+    def test_reads_the_stored_neighbours_best_first(self):
+        third = Movie.objects.create(title='Up', description='Balloons')
+        MovieSimilarity.objects.create(movie=self.movie, similar=self.other, score=0.25)
+        MovieSimilarity.objects.create(movie=self.movie, similar=third, score=0.75)
+
+        response = self.client.get(f'/api/movies/{self.movie.id}/similar/')
+        self.assertEqual([(movie['title'], movie['similarity']) for movie in response.data],
+                         [('Up', 0.75), ('Heat', 0.25)])
+        response = self.client.get(f'/api/movies/{self.movie.id}/similar/?limit=1')
+        self.assertEqual([movie['title'] for movie in response.data], ['Up'])
+
+    def test_build_pairs_movies_rated_alike(self):
+        from .recommendations import build
+
+        third = Movie.objects.create(title='Up', description='Balloons')
+        for name, votes in (('a', (5, 5, 1)), ('b', (4, 4, 2)), ('c', (1, 1, 5))):
+            user = User.objects.create_user(name)
+            for movie, stars in zip((self.movie, self.other, third), votes):
+                Rating.objects.create(user=user, movie=movie, stars=stars)
+        build()
+        response = self.client.get(f'/api/movies/{self.movie.id}/similar/')
+        self.assertEqual(response.data[0]['title'], 'Heat')
+
+    def test_unknown_or_malformed_movie(self):
+        self.assertEqual(self.client.get('/api/movies/99999999/similar/').status_code, 404)
+        self.assertEqual(self.client.get('/api/movies/abc/similar/').status_code, 400)
+        response = self.client.get(f'/api/movies/{self.movie.id}/similar/?limit=x')
+        self.assertEqual(response.status_code, 400)
+
+
+class LeaderboardTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.unrated = Movie.objects.create(title='Up', description='Balloons')
+        voters = [User.objects.create_user(f'voter{n}').id for n in range(3)]
+        for user_id in voters:
+            upsert.record_vote(user_id, self.other.id, 5)
+        upsert.record_vote(voters[0], self.movie.id, 5)
+
+    def test_top_orders_by_damped_average(self):
+        response = self.client.get('/api/movies/top/')
+        self.assertEqual([(movie['title'], movie['rank']) for movie in response.data],
+                         [('Heat', 1), ('Alien', 2)])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+        response = self.client.get('/api/movies/top/?limit=1')
+        self.assertEqual([movie['title'] for movie in response.data], ['Heat'])
+
+    def test_top_limit(self):
+        self.assertEqual(len(self.client.get('/api/movies/top/?limit=-1').data), 1)
+        self.assertEqual(self.client.get('/api/movies/top/?limit=abc').status_code, 400)
+
+    def test_rank(self):
+        ranks = [self.client.get(f'/api/movies/{movie.id}/rank/').data['rank']
+                 for movie in (self.other, self.movie, self.unrated)]
+        self.assertEqual(ranks, [1, 2, None])
+
+
+class SearchTests(APITestCase):
+
+    def search(self, query):
+        response = self.client.get('/api/movies/', {'q': query})
+        return [movie['title'] for movie in response.data]
+
+    def test_prefix_terms_on_the_fts_index(self):
+        # bulk_create skips signals: the database keeps the index in sync
+        Movie.objects.bulk_create([
+            Movie(title='Star Wars', description='A galaxy far away'),
+            Movie(title='Star Trek', description='Space, the final frontier'),
+            Movie(title='Wall-E', description='A robot and a star'),
+        ])
+        self.assertEqual(self.search('star wa'), ['Star Wars', 'Wall-E'])
+        # a title match ranks above a description match
+        self.assertEqual(self.search('STAR')[-1], 'Wall-E')
+        self.assertEqual(self.search('nothing'), [])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM movie_fts')
+                self.assertEqual(cursor.fetchone()[0], Movie.objects.count())
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rate(self.movie, 4)
+        self.rate(self.other, 2)
+        self.staff = APIClient()
+        self.staff.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def test_streams_ndjson_and_csv(self):
+        response = self.staff.get('/api/ratings/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['stars'] for line in lines], [4, 2])
+
+        response = self.staff.get('/api/ratings/export/',
+                                  {'output': 'csv', 'movie': self.other.id, 'names': 1},
+                                  HTTP_ACCEPT='text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'movie', 'user', 'stars', 'movie_title', 'username'])
+        self.assertEqual(rows[1][3:], ['2', 'Heat', 'viewer'])
+        self.assertEqual(len(rows), 2)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        token = await Token.objects.acreate(user=await User.objects.aget(username='staff'))
+        response = await self.async_client.get(
+            '/api/ratings/export/', {'output': 'csv'},
+            headers={'Authorization': f'Token {token.key}', 'Accept': 'text/csv'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual([row[3] for row in rows], ['stars', '4', '2'])
+
+    def test_errors_render_as_json(self):
+        response = self.client.get('/api/ratings/export/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(set(response.json()), {'detail'})
+
+        response = APIClient().get('/api/ratings/export/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(set(json.loads(response.content)), {'detail'})
+
+
+class ImportTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.movies = os.path.join(directory, 'movies.csv')
+        self.ratings = os.path.join(directory, 'ratings.csv')
+        with open(self.movies, 'w') as file:
+            file.write('movieId,title,genres\n1,Toy Story (1995),Animation|Comedy\n'
+                       '2,Jumanji (1995),Adventure\n')
+        with open(self.ratings, 'w') as file:
+            file.write('userId,movieId,rating,timestamp\n'
+                       '1,1,4.0,0\n1,2,3.5,0\n2,1,0.5,0\n2,9,5.0,0\n3,2,5.0,0\n')
+
+    def test_resumes_from_the_checkpoint(self):
+        self.assertEqual(importer.import_movies(self.movies, 'ml'), 2)
+        write_ratings = importer.write_ratings
+        calls = []
+
+        def interrupted(votes):
+            calls.append(votes)
+            if len(calls) == 2:
+                raise RuntimeError('connection lost')
+            return write_ratings(votes)
+
+        with mock.patch.object(importer, 'write_ratings', interrupted):
+            with self.assertRaises(RuntimeError):
+                importer.import_ratings(self.ratings, 'ml', batch_size=2)
+        point = ImportCheckpoint.objects.get(source='ml', kind='ratings')
+        self.assertEqual((point.rows, point.finished), (2, False))
+        self.assertEqual(Rating.objects.count(), 2)
+
+        # the committed first batch is not read again; movie 9 is unknown
+        self.assertEqual(importer.import_ratings(self.ratings, 'ml', batch_size=2), (2, 1))
+        self.assertEqual(
+            sorted(Rating.objects.values_list('user__username', 'movie__title', 'stars')),
+            [('ml-1', 'Jumanji (1995)', 4), ('ml-1', 'Toy Story (1995)', 4),
+             ('ml-2', 'Toy Story (1995)', 1), ('ml-3', 'Jumanji (1995)', 5)])
+        self.assertEqual(importer.import_ratings(self.ratings, 'ml'), (0, 0))
+        self.assertEqual(importer.import_movies(self.movies, 'ml'), 0)
+
+
+class SyntheticDataTests(APITestCase):
+
+    def test_clear_removes_synthetic_rows_and_recounts_real_movies(self):
+        self.rate(self.movie, 5)
+        self.assertGreater(benchmark.generate(20, 200, seed=1), 0)
+        voter = User.objects.filter(username__startswith=benchmark.SYNTHETIC_USER).first()
+        upsert.record_vote(voter.id, self.movie.id, 1)
+        self.assertAggregates(self.movie, 2, 6, {1: 1, 2: 0, 3: 0, 4: 0, 5: 1})
+
+        benchmark.clear()
+        self.assertAggregates(self.movie, 1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+        self.assertEqual(list(Movie.objects.values_list('title', flat=True).order_by('id')),
+                         ['Alien', 'Heat'])
+        self.assertEqual(list(Rating.objects.values_list('user__username', flat=True)),
+                         ['viewer'])
+
+
+
+class ServerTimingTests(APITestCase):
+
+    def test_serialization_is_timed_apart_from_the_view(self):
+        with self.assertLogs('api.timing', 'INFO') as logs:
+            response = self.client.get('/api/movies/')
+        names = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(names, ['db', 'view', 'serialize', 'render', 'total'])
+        record = json.loads(logs.records[-1].getMessage().split(' ', 1)[1])
+        self.assertGreater(record['serialize_ms'], 0)
+        self.assertLess(record['serialize_ms'] + record['view_ms'], record['total_ms'])
+
+
+class PoolMetricsTests(TestCase):
+
+    def test_reuse_comes_from_the_pool_counts(self):
+        pool = db_pool.ConnectionPool(connect=mock.Mock, min_size=0, max_size=2)
+        for _ in range(3):
+            pool.release(pool.acquire())
+        self.assertEqual((pool.stats()['opened'], pool.stats()['checkouts']), (1, 3))
+
+        with mock.patch.object(db_pool, 'stats', return_value={'default': pool.stats()}), \
+                mock.patch.object(metrics, '_pool_updated', 0.0):
+            metrics.update_pool_gauges()
+        self.assertEqual(REGISTRY.get_sample_value('movierater_db_pool_reused',
+                                                   {'alias': 'default'}), 2)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # the views query from their own threads, which only see committed rows
+
+    def setUp(self):
+        cache.clear()
+        token = Token.objects.create(user=User.objects.create_user('viewer'))
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.movies = [Movie.objects.create(title=title) for title in ('Alien', 'Heat', 'Up')]
+
+    async def test_pages_follow_next_on_database_threads(self):
+        threads = set()
+
+        def authenticate(request):
+            threads.add(threading.current_thread().name)
+            return real(request)
+
+        real = async_views.authenticate
+        with mock.patch.object(async_views, 'authenticate', authenticate):
+            first = await self.async_client.get('/api/async/movies/', {'page_size': 2},
+                                                headers=self.headers)
+            second = await self.async_client.get(first.json()['next'], headers=self.headers)
+        first, second = first.json(), second.json()
+        self.assertEqual([movie['title'] for movie in first['results']], ['Alien', 'Heat'])
+        self.assertEqual([movie['title'] for movie in second['results']], ['Up'])
+        self.assertIsNone(second['next'])
+        self.assertEqual({name.split('_')[0] for name in threads}, {'async-db'})
+
+    async def test_detail_and_errors(self):
+        response = await self.async_client.get(f'/api/async/movies/{self.movies[1].id}/',
+                                               headers=self.headers)
+        self.assertEqual(response.json()['title'], 'Heat')
+        response = await self.async_client.get('/api/async/movies/0/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/api/async/ratings/')
+        self.assertEqual(response.status_code, 401)
+
+
+class SparseFieldsTests(APITestCase):
+
+    def test_fields_and_exclude_narrow_the_output(self):
+        response = self.client.get('/api/movies/', {'fields': 'id,title'})
+        self.assertEqual([set(movie) for movie in response.data['results']],
+                         [{'id', 'title'}] * 2)
+
+        response = self.client.get(f'/api/movies/{self.movie.id}/',
+                                   {'exclude': 'description,ratings_histogram'})
+        self.assertEqual(response.data['title'], 'Alien')
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('ratings_histogram', response.data)
+        self.assertIn('ave_ratings', response.data)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/movies/', {'fields': 'id,budget'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('budget', str(response.data['fields']))
+
+    def test_compact_list(self):
+        response = self.client.get('/api/movies/', {'compact': 1})
+        movie = response.data['results'][0]
+        self.assertNotIn('description', movie)
+        self.assertNotIn('ratings_histogram', movie)
+        self.assertEqual(movie['title'], 'Alien')
+
+
+class MessagePackTests(APITestCase):
+
+    def test_responses_match_json(self):
+        self.rate(self.movie, 4)
+        path = f'/api/movies/{self.movie.id}/'
+        response = self.client.get(path, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data, self.client.get(path).json())
+        self.assertEqual(data['ratings_histogram']['4'], 1)
+
+    def test_request_bodies(self):
+        response = self.client.post(f'/api/movies/{self.other.id}/rate_movie/',
+                                    msgpack.packb({'stars': 5}),
+                                    content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['message'], 'Rating created!')
+        self.assertAggregates(self.other, 1, 5, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+
+class MovieBatchTests(APITestCase):
+
+    def test_ids_keep_the_request_order(self):
+        up = Movie.objects.create(title='Up')
+        response = self.client.get('/api/movies/',
+                                   {'ids': f'{up.id},{self.movie.id},0,{up.id},{self.other.id}'})
+        self.assertEqual([movie['title'] for movie in response.data], ['Up', 'Alien', 'Heat'])
+
+        response = self.client.post('/api/movies/batch/',
+                                    {'ids': [self.other.id, up.id]}, format='json')
+        self.assertEqual([movie['title'] for movie in response.data], ['Heat', 'Up'])
+
+    def test_bad_ids_are_rejected(self):
+        self.assertEqual(self.client.get('/api/movies/', {'ids': '1,x'}).status_code, 400)
+        response = self.client.post('/api/movies/batch/', {'ids': '1,2'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(MOVIE_BATCH_MAX_IDS=2):
+            response = self.client.post('/api/movies/batch/', {'ids': [1, 2, 3]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class MyRatingTests(APITestCase):
+
+    def test_include_adds_the_callers_stars(self):
+        self.rate(self.movie, 4)
+        response = self.client.get('/api/movies/', {'include': 'my_rating'})
+        self.assertEqual([movie['my_rating'] for movie in response.data['results']], [4, None])
+        response = self.client.get(f'/api/movies/{self.movie.id}/', {'include': 'my_rating'})
+        self.assertEqual(response.data['my_rating'], 4)
+        self.assertNotIn('my_rating', self.client.get('/api/movies/').data['results'][0])
+
+    def test_cached_responses_are_per_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate(self.movie, 4)
+        self.client.get('/api/movies/', {'include': 'my_rating'})
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other'))
+        response = other.get('/api/movies/', {'include': 'my_rating'})
+        self.assertEqual([movie['my_rating'] for movie in response.data['results']], [None, None])
+
+    def test_unknown_includes_are_rejected(self):
+        response = self.client.get('/api/movies/', {'include': 'my_rating,reviews'})
+        self.assertEqual(response.status_code, 400)
+
+
+def poster(color):
+    content = io.BytesIO()
+    Image.new('RGB', (400, 600), color).save(content, 'PNG')
+    content.seek(0)
+    content.name = 'poster.png'
+    return content
+
+
+class PosterUploadTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        # make thumbnails now rather than on the background pool
+        self.enterContext(mock.patch.object(images, 'schedule_thumbnails',
+                                            images.make_thumbnails))
+
+    def upload(self, color='red'):
+        return self.client.post('/api/movies/upload_image/', {'image': poster(color)})
+
+    def test_same_image_is_stored_once(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data['sha256'], second.data['sha256'])
+        self.assertNotEqual(self.upload('blue').data['sha256'], first.data['sha256'])
+        directory = images._directory(first.data['sha256'])
+        self.assertEqual(len(list(directory.glob('original.*'))), 1)
+
+        response = self.client.post('/api/movies/get_upload_url/',
+                                    {'fileHash': first.data['sha256']}, format='json')
+        self.assertTrue(response.data['exists'])
+        self.assertEqual(response.data['public_url'], first.data['public_url'])
+
+    def test_thumbnails_are_made_at_the_configured_sizes(self):
+        data = self.upload().data
+        directory = images._directory(data['sha256'])
+        for size, (width, height) in settings.THUMBNAIL_SIZES.items():
+            self.assertTrue((directory / f'{size}.jpg').exists())
+            response = self.client.get(data['thumbnails'][size]['webp'])
+            self.assertEqual(response['Content-Type'], 'image/webp')
+            self.assertIn('immutable', response['Cache-Control'])
+            image = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+            self.assertEqual(image.size, (width, height))
+
+    def test_rejects_files_that_are_not_images(self):
+        content = io.BytesIO(b'not an image')
+        content.name = 'poster.png'
+        response = self.client.post('/api/movies/upload_image/', {'image': content})
+        self.assertEqual(response.status_code, 400)
+
+
+class ObjectStorageTests(PosterUploadTests):
+    """The poster uploads again, with the bucket on moto's mock S3."""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.dict(os.environ, {
+            'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'}))
+        self.enterContext(mock_aws())
+        self.enterContext(self.settings(AWS_STORAGE_BUCKET_NAME='posters',
+                                        AWS_S3_ENDPOINT_URL=None))
+        storage.client().create_bucket(Bucket='posters', CreateBucketConfiguration={
+            'LocationConstraint': settings.AWS_S3_REGION_NAME})
+
+    def upload_url(self, sha256, filename='poster.png'):
+        return self.client.post('/api/movies/get_upload_url/', {
+            'fileHash': sha256, 'filename': filename, 'contentType': 'image/png'},
+            format='json').data
+
+    def test_same_image_is_stored_once(self):
+        sha256 = 'ab' * 32
+        first = self.upload_url(sha256)
+        self.assertFalse(first['exists'])
+        self.assertEqual(first['key'], storage.poster_key(sha256, 'png'))
+        # the presigned URL for a content hash is handed out again
+        self.assertEqual(self.upload_url(sha256)['upload_url'], first['upload_url'])
+        self.assertNotEqual(self.upload_url('')['upload_url'], first['upload_url'])
+
+        uploaded = self.upload().data
+        self.assertEqual(uploaded['public_url'],
+                         storage.public_url(storage.poster_key(uploaded['sha256'], 'png')))
+        self.assertTrue(self.upload_url(uploaded['sha256'])['exists'])
+        self.assertEqual(self.upload().data['sha256'], uploaded['sha256'])
+        listing = storage.client().list_objects_v2(Bucket='posters')
+        self.assertEqual([item['Key'] for item in listing['Contents']],
+                         [storage.poster_key(uploaded['sha256'], 'png')])
+
+    def test_thumbnails_come_from_the_bucket_original(self):
+        sha256 = self.upload().data['sha256']
+        shutil.rmtree(images._directory(sha256))
+        response = self.client.get(images.thumbnail_url(sha256, 'small', 'jpg'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(images._original(sha256).exists())
+        self.assertEqual(self.client.get(images.thumbnail_url('cd' * 32)).status_code, 404)
@@ -0,0 +1,85 @@
+"""
+Per-request SQL timing.
+
+Every database connection gets an execute wrapper when it opens (see
+signals.py). While a request is being timed, the wrapper adds each query's
+duration to the request's RequestStats and keeps the slowest few statements
+as a sample; serialize() does the same for building serializer output.
+Outside a timed request it only does a ContextVar lookup. The cost per
+query is two perf_counter() calls and a small heap push, so the wrapper can
+stay on in production.
+"""
+import heapq
+import time
+from contextvars import ContextVar
+
+SLOW_QUERY_SAMPLE = 5
+
+current = ContextVar('api_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serialize_time', 'slowest', '_order')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.slowest = []  # min-heap of (duration, order, sql)
+        self._order = 0
+
+    def add(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self._order += 1
+        entry = (duration, self._order, sql)
+        if len(self.slowest) < SLOW_QUERY_SAMPLE:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def slow_queries(self):
+        """The sampled statements, slowest first, with times in ms."""
+        return [{'ms': round(duration * 1000, 3), 'sql': sql}
+                for duration, _, sql in sorted(self.slowest, reverse=True)]
+
+
+def start():
+    """Begin timing the current request; returns (stats, reset token)."""
+    stats = RequestStats()
+    return stats, current.set(stats)
+
+
+def stop(token):
+    current.reset(token)
+
+
+def serialize(serializer):
+    """
+    Evaluate serializer.data now if the request is timed, adding the time.
+
+    The serializer keeps the result, so the view's own .data call is free.
+    """
+    stats = current.get()
+    if stats is not None:
+        started = time.perf_counter()
+        serializer.data
+        stats.serialize_time += time.perf_counter() - started
+    return serializer
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - started)
+
+
+def install(connection):
+    """Add the timing wrapper to a newly opened connection, once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
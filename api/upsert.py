@@ -0,0 +1,218 @@
+"""
+Batched rating upserts.
+
+Votes are written with INSERT ... ON CONFLICT (PostgreSQL, SQLite) or MERGE
+(SQL Server) against the unique_user_movie_rating constraint, so two
+concurrent first votes by the same user can no longer race into an
+IntegrityError. Each statement joins the movie table, so votes for unknown
+movies are skipped without a separate lookup, and reports the previous
+number of stars so the movie aggregates can be adjusted without reading the
+ratings again. A single vote is simply a batch of one.
+"""
+from collections import namedtuple
+
+from django.db import connections, router, transaction
+
+from . import aggregates
+from .models import Movie, Rating
+
+# id of the stored rating, whether it was inserted and the stars it had before
+UpsertResult = namedtuple('UpsertResult', ['id', 'created', 'old_stars'])
+
+# rows per statement; keeps SQL Server under its 2100 parameter limit
+BATCH_SIZE = 500
+
+
+def _names(connection):
+    qn = connection.ops.quote_name
+    return {
+        'rating': qn(Rating._meta.db_table),
+        'movie': qn(Movie._meta.db_table),
+        'id': qn('id'),
+        'user': qn(Rating._meta.get_field('user').column),
+        'movie_fk': qn(Rating._meta.get_field('movie').column),
+        'stars': qn('stars'),
+    }
+
+
+def _values(votes):
+    rows = ', '.join(['(%s, %s)'] * len(votes))
+    params = [value for vote in votes.items() for value in vote]
+    return rows, params
+
+
+def _upsert_postgresql(cursor, names, user_id, votes):
+    # prev locks the existing rows first (the insert depends on it), so its
+    # stars are the latest committed values even under concurrent votes
+    rows, params = _values(votes)
+    placeholders = ', '.join(['%s'] * len(votes))
+    cursor.execute(
+        '''
+        WITH prev AS (
+            SELECT {movie_fk}, {stars} FROM {rating}
+            WHERE {user} = %s AND {movie_fk} IN ({placeholders})
+            FOR UPDATE
+        ), up AS (
+            INSERT INTO {rating} ({user}, {movie_fk}, {stars})
+            SELECT %s, m.{id}, v.stars
+            FROM (VALUES {rows}) AS v (movie_id, stars)
+            JOIN {movie} m ON m.{id} = v.movie_id
+            WHERE (SELECT COUNT(*) FROM prev) >= 0
+            ON CONFLICT ({user}, {movie_fk})
+            DO UPDATE SET {stars} = EXCLUDED.{stars}
+            RETURNING {id}, {movie_fk}, (xmax = 0) AS inserted
+        )
+        SELECT up.{id}, up.{movie_fk}, up.inserted, prev.{stars}
+        FROM up LEFT JOIN prev ON prev.{movie_fk} = up.{movie_fk}
+        '''.format(rows=rows, placeholders=placeholders, **names),
+        [user_id, *votes, user_id, *params])
+    return {movie_id: UpsertResult(rating_id, inserted, old_stars)
+            for rating_id, movie_id, inserted, old_stars in cursor.fetchall()}
+
+
+def _upsert_sqlite(cursor, names, user_id, votes):
+    # SQLite serializes writers, so reading the old values first inside the
+    # same transaction is exact; the upsert itself is still one statement
+    placeholders = ', '.join(['%s'] * len(votes))
+    cursor.execute(
+        'SELECT {movie_fk}, {stars} FROM {rating} '
+        'WHERE {user} = %s AND {movie_fk} IN ({placeholders})'
+        .format(placeholders=placeholders, **names),
+        [user_id, *votes])
+    previous = dict(cursor.fetchall())
+
+    rows, params = _values(votes)
+    cursor.execute(
+        '''
+        INSERT INTO {rating} ({user}, {movie_fk}, {stars})
+        SELECT %s, m.{id}, v.column2
+        FROM (VALUES {rows}) AS v
+        JOIN {movie} m ON m.{id} = v.column1
+        WHERE true
+        ON CONFLICT ({user}, {movie_fk}) DO UPDATE SET {stars} = excluded.{stars}
+        RETURNING {id}, {movie_fk}
+        '''.format(rows=rows, **names),
+        [user_id, *params])
+    return {movie_id: UpsertResult(rating_id, movie_id not in previous,
+                                   previous.get(movie_id))
+            for rating_id, movie_id in cursor.fetchall()}
+
+
+def _upsert_mssql(cursor, names, user_id, votes):
+    # HOLDLOCK keeps the key range locked between the match and the write
+    rows, params = _values(votes)
+    cursor.execute(
+        '''
+        MERGE {rating} WITH (HOLDLOCK) AS target
+        USING (
+            SELECT m.{id} AS movie_id, v.stars
+            FROM (VALUES {rows}) AS v (movie_id, stars)
+            JOIN {movie} m ON m.{id} = v.movie_id
+        ) AS source
+        ON target.{user} = %s AND target.{movie_fk} = source.movie_id
+        WHEN MATCHED THEN
+            UPDATE SET {stars} = source.stars
+        WHEN NOT MATCHED THEN
+            INSERT ({user}, {movie_fk}, {stars})
+            VALUES (%s, source.movie_id, source.stars)
+        OUTPUT inserted.{id}, inserted.{movie_fk},
+               CASE WHEN $action = 'INSERT' THEN 1 ELSE 0 END,
+               deleted.{stars};
+        '''.format(rows=rows, **names),
+        [*params, user_id, user_id])
+    return {movie_id: UpsertResult(rating_id, bool(inserted), old_stars)
+            for rating_id, movie_id, inserted, old_stars in cursor.fetchall()}
+
+
+def _upsert_orm(using, user_id, votes):
+    # portable fallback for backends without a native upsert
+    results = {}
+    existing = set(Movie.objects.using(using).filter(id__in=list(votes))
+                   .values_list('id', flat=True))
+    ratings = {rating.movie_id: rating for rating in
+               Rating.objects.using(using).select_for_update()
+               .filter(user=user_id, movie__in=existing)}
+    for movie_id in existing:
+        stars = votes[movie_id]
+        rating = ratings.get(movie_id)
+        if rating is None:
+            rating = Rating.objects.using(using).create(
+                user_id=user_id, movie_id=movie_id, stars=stars)
+            results[movie_id] = UpsertResult(rating.id, True, None)
+        else:
+            results[movie_id] = UpsertResult(rating.id, False, rating.stars)
+            rating.stars = stars
+            rating.save(update_fields=['stars'])
+    return results
+
+
+def upsert_ratings(user_id, votes, using=None):
+    """
+    Insert or update one user's votes, given as a {movie_id: stars} dict.
+
+    Returns a {movie_id: UpsertResult} dict with an entry for every movie
+    that exists; votes for unknown movies are left out. Must be called
+    inside a transaction on the same database.
+    """
+    using = using or router.db_for_write(Rating)
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        upsert = _upsert_postgresql
+    elif connection.vendor == 'microsoft':
+        upsert = _upsert_mssql
+    elif (connection.vendor == 'sqlite'
+            and connection.features.can_return_columns_from_insert):
+        upsert = _upsert_sqlite
+    else:
+        return _upsert_orm(using, user_id, votes)
+
+    names = _names(connection)
+    movie_ids = list(votes)
+    results = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(movie_ids), BATCH_SIZE):
+            batch = {movie_id: votes[movie_id]
+                     for movie_id in movie_ids[start:start + BATCH_SIZE]}
+            results.update(upsert(cursor, names, user_id, batch))
+    return results
+
+
+def upsert_rating(user_id, movie_id, stars, using=None):
+    """
+    Insert or update one user's vote for a movie.
+
+    Returns an UpsertResult, or None when the movie does not exist.
+    """
+    return upsert_ratings(user_id, {movie_id: stars}, using).get(movie_id)
+
+
+def record_votes(user_id, votes):
+    """
+    Store a user's votes and adjust the movie aggregates in one transaction.
+
+    Takes and returns the same shapes as upsert_ratings().
+    """
+    using = router.db_for_write(Rating)
+    with transaction.atomic(using=using):
+        results = upsert_ratings(user_id, votes, using=using)
+        changes, unknown = [], []
+        for movie_id, result in results.items():
+            if not result.created and result.old_stars is None:
+                # lost a race with a concurrent first vote by the same user,
+                # so the previous value is unknown; recount this movie instead
+                unknown.append(movie_id)
+            else:
+                changes.append((movie_id, result.old_stars, votes[movie_id]))
+        aggregates.apply_votes(changes)
+        if unknown:
+            aggregates.rebuild(unknown)
+    return results
+
+
+def record_vote(user_id, movie_id, stars):
+    """
+    Store a vote and adjust the movie aggregates in one transaction.
+
+    Returns the UpsertResult, or None when the movie does not exist.
+    """
+    return record_votes(user_id, {movie_id: stars}).get(movie_id)
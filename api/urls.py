@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework import routers
 from django.conf.urls import include
+from . import async_views, images
 from .views import UserViewSet, MovieViewSet, RatingViewSet
 
 
@@ -12,4 +13,11 @@ router.register('ratings', RatingViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # async read path, for ASGI deployments
+    path('async/movies/', async_views.movie_list, name='async-movie-list'),
+    path('async/movies/<int:pk>/', async_views.movie_detail, name='async-movie-detail'),
+    path('async/ratings/', async_views.rating_list, name='async-rating-list'),
+    # uploaded posters and their thumbnails, by content hash
+    re_path(r'^images/(?P<sha256>[0-9a-f]{64})/(?P<name>\w+)\.(?P<extension>jpg|png|webp|gif)$',
+            images.image_view, name='image'),
 ]
@@ -1,100 +1,398 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Case, When, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Movie, Rating
-from .serializers import MovieSerializer, RatingSerializer, UserSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from movierater import database_router
+from . import (cache as cache_versions, export, images, leaderboard, s3_utils, search,
+               storage, upsert)
+from .authentication import CachedTokenAuthentication
+from .mixins import CachedResponseMixin, ValuesReadMixin
+from .models import Movie, MovieSimilarity, Rating
+from .pagination import (MovieCursorPagination, RatingCursorPagination,
+                         UserRatingCursorPagination)
+from .renderers import ORJSONRenderer, PassthroughRenderer
+from .serializers import (MovieCompactSerializer, MovieCompactValuesSerializer,
+                          MovieSerializer, MovieValuesSerializer, RatingSerializer,
+                          RatingValuesSerializer, UserSerializer, my_rating_prefetch,
+                          my_ratings)
 
 
 # Create your views here.
 
 
+def whole_number(value):
+    """value as an int if it is a whole number, else None."""
+    # int() would turn True into 1 and truncate 4.9 to 4
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class UserViewSet(viewsets.ModelViewSet):
     permission_classes = (AllowAny, )
     # query everything from the movie model db
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    @action(detail=False, methods=['GET'], url_path='me/ratings',
+            authentication_classes=(CachedTokenAuthentication, ),
+            permission_classes=(IsAuthenticated, ))
+    def my_ratings(self, request):
+        """
+        The caller's own ratings, ordered by movie id.
+
+        Cursor paginated like /api/ratings/; each page is a range scan of
+        the (user, movie) index.
+        """
+        queryset = (Rating.objects.filter(user=request.user)
+                    .values(*RatingValuesSerializer().columns()))
+        paginator = UserRatingCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(RatingValuesSerializer(page, many=True).data)
 
-class MovieViewSet(viewsets.ModelViewSet):
+
+class MovieViewSet(CachedResponseMixin, ValuesReadMixin, viewsets.ModelViewSet):
     # query everything from the movie model db
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
-    authentication_classes = (TokenAuthentication, )
+    values_serializers = {
+        MovieSerializer: MovieValuesSerializer,
+        MovieCompactSerializer: MovieCompactValuesSerializer,
+    }
+    values_actions = ('list', 'retrieve', 'batch')
+    pagination_class = MovieCursorPagination
+    authentication_classes = (CachedTokenAuthentication, )
 
     # add permission class to MovieViewSet view function
     permission_classes = (IsAuthenticated, )
 
+    def get_serializer_class(self):
+        # ?compact=1 lists movies without description and histogram
+        if self.action == 'list' and self.request.query_params.get('compact') in ('1', 'true'):
+            return MovieCompactSerializer
+        return super().get_serializer_class()
+
+    def _field_names(self, param):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        return [name for name in (part.strip() for part in value.split(',')) if name]
+
+    def field_kwargs(self):
+        # ?fields=id,title and ?exclude=description narrow list/detail output
+        if self.action not in self.values_actions:
+            return {}
+        fields, exclude = self._field_names('fields'), self._field_names('exclude')
+        known = self.get_serializer_class().Meta.fields
+        unknown = [name for name in (fields or []) + (exclude or [])
+                   if name not in known]
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(unknown)}'})
+        return {'fields': fields, 'exclude': exclude}
+
+    def include_my_rating(self):
+        # ?include=my_rating adds the caller's own stars to each movie
+        include = self._field_names('include') or []
+        unknown = [name for name in include if name != 'my_rating']
+        if unknown:
+            raise ValidationError({'include': f'Unknown includes: {", ".join(unknown)}'})
+        return bool(include)
+
+    def cache_parts(self):
+        # with the caller's rating in it, a response is theirs alone
+        if self.include_my_rating():
+            return (f'user:{self.request.user.id}', )
+        return ()
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.values_serializer_class() and self.include_my_rating():
+            # one query for the caller's ratings of all the movies
+            many = kwargs.get('many', False)
+            rows = list(args[0]) if many else [args[0]]
+            kwargs['my_ratings'] = my_ratings(self.request.user,
+                                              [row['id'] for row in rows])
+            args = (rows if many else args[0], *args[1:])
+        return super().get_serializer(*args, **kwargs)
+
+    def requested_ids(self):
+        """
+        Movie ids from ?ids=1,2,3 (list) or {"ids": [...]} (batch), or None.
+
+        Duplicates are dropped, keeping the first position of each id.
+        """
+        if self.action == 'batch':
+            ids = self.request.data.get('ids') if isinstance(self.request.data, dict) else None
+            if not isinstance(ids, list):
+                raise ValidationError({'ids': 'Send a list of movie ids'})
+        elif self.action == 'list' and 'ids' in self.request.query_params:
+            ids = [part for part in self.request.query_params['ids'].split(',') if part.strip()]
+        else:
+            return None
+        try:
+            ids = list(dict.fromkeys(int(movie_id) for movie_id in ids))
+        except (TypeError, ValueError):
+            raise ValidationError({'ids': 'Movie ids must be whole numbers'})
+        if len(ids) > settings.MOVIE_BATCH_MAX_IDS:
+            raise ValidationError(
+                {'ids': f'At most {settings.MOVIE_BATCH_MAX_IDS} ids per request'})
+        return ids
+
+    def _in_order(self, queryset, ids):
+        order = Case(*[When(id=movie_id, then=position)
+                       for position, movie_id in enumerate(ids)])
+        return queryset.filter(id__in=ids).order_by(order) if ids else queryset.none()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ids = self.requested_ids()
+        if ids is not None:
+            # ?ids= / batch: one query for all of them, in request order
+            return self._in_order(queryset, ids)
+        query = self.request.query_params.get('q')
+        if self.action == 'list' and query:
+            # ?q= full-text search, best match first
+            ids = search.search(query, limit=settings.SEARCH_MAX_RESULTS)
+            queryset = self._in_order(queryset, ids)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        # search results are ranked and capped, and id batches are returned
+        # whole, not paged by id
+        if self.request.query_params.get('q') or 'ids' in self.request.query_params:
+            return None
+        return super().paginate_queryset(queryset)
+
+    @action(detail=False, methods=['POST'])
+    def batch(self, request):
+        """
+        Movies for a list of ids too long for ?ids=, in request order.
+
+        Body: {"ids": [3, 1, 2]}. Unknown ids are left out; ?fields=,
+        ?exclude= and ?include= work as on the list.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(self.get_serializer(queryset, many=True).data,
+                        status=status.HTTP_200_OK)
+
     # for a specific movie, True using method POST
     @action(detail=True, methods=['POST'])
     def rate_movie(self, request, pk=None):
         if 'stars' in request.data:
-            
-            # select movie from db using primary key
-            movie = Movie.objects.get(id=pk)
-            stars = request.data['stars']
+            stars = whole_number(request.data['stars'])
+            if stars is None or not 1 <= stars <= 5:
+                response = {'message': 'Stars must be a whole number from 1 to 5'}
+                return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
             user = request.user
             # work around to specify fixed user id for building views
             # user = User.objects.get(id=1)
             # print('user', user.username + ' ✔')
 
             try:
-                rating = Rating.objects.get(user=user.id,
-                                            movie=movie.id)  # stored in db
-                rating.stars = stars
-                rating.save()
-                serializer = RatingSerializer(rating, many=False)
-                response = {'message': 'Rating Updated!', 
-                            'result': serializer.data}
-                return Response(response, status=status.HTTP_200_OK)
-            except Rating.DoesNotExist:
-                # pass whole objects
-                rating = Rating.objects.create(user=user,
-                                               movie=movie,
-                                               stars=stars)
-                response = {'message': 'Rating created!',
-                            'result': serializer.data}
-                return Response(response, status=status.HTTP_200_OK)
+                movie_id = int(pk)
+            except (TypeError, ValueError):
+                movie_id = None
+            # one upsert statement writes the vote and returns the old stars
+            result = upsert.record_vote(user.id, movie_id, stars) if movie_id else None
+            if result is None:
+                response = {'message': 'Movie not found'}
+                return Response(response, status=status.HTTP_404_NOT_FOUND)
+            # read this user's requests from the primary until replicas catch up
+            database_router.pin_user(user.id)
+
+            rating = Rating(id=result.id, user_id=user.id,
+                            movie_id=movie_id, stars=stars)
+            message = 'Rating created!' if result.created else 'Rating Updated!'
+            serializer = RatingSerializer(rating, many=False)
+            response = {'message': message,
+                        'result': serializer.data}
+            return Response(response, status=status.HTTP_200_OK)
 
         else:
             response = {'message': 'You need to provide stars'}
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['GET'])
+    def top(self, request):
+        """
+        Top-rated movies by Bayesian average, best first.
+
+        ?limit= sets how many to return (default 10, max 100). Each movie
+        carries its leaderboard rank and score.
+        """
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+        except ValueError:
+            raise ValidationError({'limit': 'limit must be a whole number'})
+        version = cache_versions.collection_version()
+        key = cache_versions.response_key('api:movies:top', request, version,
+                                          *self.cache_parts())
+        return self._cached(key, version, self._top, request, limit)
+
+    def _top(self, request, limit):
+        movies = list(leaderboard.top(limit))
+        include_my_rating = self.include_my_rating()
+        if include_my_rating:
+            prefetch_related_objects(movies, my_rating_prefetch(request.user))
+        response = []
+        for position, movie in enumerate(movies, start=1):
+            data = MovieSerializer(movie, my_rating=include_my_rating).data
+            data['rank'] = position
+            data['score'] = round(movie.bayes_score, 4)
+            response.append(data)
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['GET'])
+    def rank(self, request, pk=None):
+        """Leaderboard position of one movie (null while it has no ratings)."""
+        movie = self.get_object()
+        response = {'id': movie.id,
+                    'rank': leaderboard.rank(movie),
+                    'score': round(movie.bayes_score, 4)}
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk=None):
+        """
+        Movies most similar to this one, best match first.
+
+        Reads the neighbours precomputed by `manage.py build_similar_movies`;
+        ?limit= caps the number returned (default 10).
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise ValidationError({'movie': 'Movie ids must be whole numbers'})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            raise ValidationError({'limit': 'limit must be a whole number'})
+        neighbours = list(MovieSimilarity.objects.filter(movie=pk)
+                          .select_related('similar').order_by('-score')[:limit])
+        if not neighbours and not Movie.objects.filter(pk=pk).exists():
+            raise NotFound('No Movie matches the given query.')
+        include_my_rating = self.include_my_rating()
+        if include_my_rating:
+            prefetch_related_objects([neighbour.similar for neighbour in neighbours],
+                                     my_rating_prefetch(request.user))
+        response = []
+        for neighbour in neighbours:
+            movie = MovieSerializer(neighbour.similar, my_rating=include_my_rating).data
+            movie['similarity'] = round(neighbour.score, 4)
+            response.append(movie)
+        return Response(response, status=status.HTTP_200_OK)
+
+    def perform_create(self, serializer):
+        serializer.save(**self._image_hash(serializer))
+
+    def perform_update(self, serializer):
+        serializer.save(**self._image_hash(serializer))
+
+    def _image_hash(self, serializer):
+        # an imagePath from upload_image links the movie to its thumbnails
+        if 'imagePath' not in serializer.validated_data:
+            return {}
+        return {'image_sha256': images.sha256_from_url(serializer.validated_data['imagePath'])}
+
     @action(detail=False, methods=['POST'])
     def get_upload_url(self, request):
         """
-        File upload endpoint - currently disabled as S3 support has been removed.
-        
-        To enable file uploads, you can either:
-        1. Re-enable S3 support by adding boto3 to requirements.txt and configuring AWS credentials
-        2. Implement local file upload handling  
-        3. Use a different cloud storage provider
-        
-        For now, movie images should be referenced by URL in the imagePath field.
-        
-        Returns HTTP 501 Not Implemented with guidance message.
-        """
-
-        
-        # File upload is currently disabled since S3 support was removed
-        return Response(
-            {
-                'error': 'File upload is currently disabled. S3 support has been removed to simplify deployment.',
-                'message': 'Please use direct image URLs in the imagePath field instead.',
-                'example': 'https://example.com/path/to/movie-poster.jpg',
-                'note': 'To re-enable uploads, add boto3 to requirements.txt and configure AWS credentials.'
-            },
-            status=status.HTTP_501_NOT_IMPLEMENTED
-        )
-
-
-class RatingViewSet(viewsets.ModelViewSet):
+        Where to upload a movie poster.
+
+        With object storage configured this is a presigned S3 PUT URL (see
+        api.s3_utils); otherwise posters are uploaded to this server (see
+        upload_image). Send the SHA-256 of the file as fileHash and, if that
+        image is already stored, exists is true and the upload can be
+        skipped: public_url already serves it.
+        """
+        file_hash = request.data.get('fileHash')
+        file_hash = file_hash.lower() if isinstance(file_hash, str) else None
+        if not storage.configured():
+            response = {
+                'upload_url': request.build_absolute_uri(reverse('movie-upload-image')),
+                'method': 'POST',
+                'field': 'image',
+                'max_size': settings.IMAGE_UPLOAD_MAX_BYTES,
+                'exists': False,
+            }
+            public_url = images.original_url(file_hash) if file_hash else None
+            if public_url:
+                response['exists'] = True
+                response['public_url'] = request.build_absolute_uri(public_url)
+            return Response(response, status=status.HTTP_200_OK)
+
+        content_type = request.data.get('contentType') or 'image/jpeg'
+        if content_type not in images.CONTENT_TYPES.values():
+            response = {'message': 'contentType must be image/jpeg, image/png, '
+                                   'image/webp or image/gif'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            response = s3_utils.generate_presigned_upload_url(
+                str(request.data.get('filename') or 'poster.jpg'), content_type, file_hash)
+            response['exists'] = bool(file_hash) and storage.exists(response['key'])
+        except storage.StorageError as error:
+            response = {'message': str(error)}
+            return Response(response, status=status.HTTP_502_BAD_GATEWAY)
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['POST'], parser_classes=(MultiPartParser, ))
+    def upload_image(self, request):
+        """
+        Upload a poster as the multipart field "image".
+
+        The file is streamed to disk and stored once per SHA-256 (and copied
+        to the bucket, with object storage configured), and its thumbnails
+        are made in the background. Set the returned public_url as a
+        movie's imagePath to use it.
+        """
+        # hash the upload as it is written to disk; must be set before the
+        # body is read
+        request._request.upload_handlers = [images.HashingUploadHandler(request._request)]
+        upload = request.FILES.get('image')
+        if upload is None:
+            max_size = settings.IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)
+            response = {'message': f'Send an image of at most {max_size} MB '
+                                   'in the "image" field'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sha256, extension = images.store(upload)
+        except images.InvalidImage as error:
+            response = {'message': str(error)}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        except storage.StorageError as error:
+            response = {'message': str(error)}
+            return Response(response, status=status.HTTP_502_BAD_GATEWAY)
+
+        thumbnails = {size: {fmt: request.build_absolute_uri(
+                                 images.thumbnail_url(sha256, size, fmt))
+                             for fmt in images.THUMBNAIL_FORMATS}
+                      for size in settings.THUMBNAIL_SIZES}
+        response = {
+            'sha256': sha256,
+            'public_url': request.build_absolute_uri(images.public_url(sha256, extension)),
+            'thumbnails': thumbnails,
+        }
+        return Response(response, status=status.HTTP_201_CREATED)
+
+
+class RatingViewSet(ValuesReadMixin, viewsets.ModelViewSet):
     # query everything from the movie model db
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
-    authentication_classes = (TokenAuthentication, )
+    values_serializers = {RatingSerializer: RatingValuesSerializer}
+    pagination_class = RatingCursorPagination
+    authentication_classes = (CachedTokenAuthentication, )
     # add permission class to RatingViewSet view function
     permission_classes = (IsAuthenticated, )
 
@@ -105,3 +403,92 @@ class RatingViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         response = {'message': 'You can\'t create ratings like that'}
         return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+    # errors DRF raises before the view runs (401, 403) render as JSON; the
+    # passthrough renderer only lets any Accept header reach the stream
+    @action(detail=False, methods=['GET'], permission_classes=(IsAdminUser, ),
+            renderer_classes=(ORJSONRenderer, PassthroughRenderer))
+    def export(self, request):
+        """
+        Stream ratings as NDJSON (default) or CSV for analytics (staff only).
+
+        ?output=ndjson|csv, optional ?movie=, ?user=, ?min_id=, ?max_id=
+        filters, and ?names=1 to add movie titles and usernames.
+        """
+        params = request.query_params
+        output = params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            response = {'message': 'output must be ndjson or csv'}
+            return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
+        filters = {}
+        for name in ('movie', 'user', 'min_id', 'max_id'):
+            if params.get(name):
+                try:
+                    filters[name] = int(params[name])
+                except ValueError:
+                    response = {'message': f'{name} must be a number'}
+                    return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
+
+        header, rows = export.ratings(names=params.get('names') in ('1', 'true'),
+                                      **filters)
+        # an ASGI server needs an async iterator to stream the rows
+        stream = (export.astream if isinstance(request._request, ASGIRequest)
+                  else export.stream)
+        response = StreamingHttpResponse(stream(output, header, rows),
+                                         content_type=export.FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="ratings.{output}"'
+        return response
+
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request):
+        """
+        Create or update many of the caller's ratings in one request.
+
+        Accepts a list of {"movie": id, "stars": 1-5} items, either as the
+        request body or under a "ratings" key. Returns the counts and one
+        status per item, in request order: created, updated, invalid,
+        not_found or duplicate (a later item for the same movie wins).
+        """
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('ratings')
+        if not isinstance(items, list):
+            response = {'message': 'Provide a list of ratings'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.RATING_BULK_MAX_ITEMS:
+            response = {'message': f'At most {settings.RATING_BULK_MAX_ITEMS} '
+                                   'ratings can be sent per request'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        # validate everything in one pass, keeping the last vote per movie
+        statuses = ['invalid'] * len(items)
+        votes, positions = {}, {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            movie_id = whole_number(item.get('movie'))
+            stars = whole_number(item.get('stars'))
+            if movie_id is None or stars is None or not 1 <= stars <= 5:
+                continue
+            if movie_id in positions:
+                statuses[positions[movie_id]] = 'duplicate'
+            votes[movie_id] = stars
+            positions[movie_id] = index
+
+        results = upsert.record_votes(request.user.id, votes) if votes else {}
+        if results:
+            database_router.pin_user(request.user.id)
+        for movie_id, index in positions.items():
+            result = results.get(movie_id)
+            if result is None:
+                statuses[index] = 'not_found'
+            else:
+                statuses[index] = 'created' if result.created else 'updated'
+
+        response = {
+            'created': statuses.count('created'),
+            'updated': statuses.count('updated'),
+            'failed': statuses.count('invalid') + statuses.count('not_found'),
+            'results': statuses,
+        }
+        return Response(response, status=status.HTTP_200_OK)
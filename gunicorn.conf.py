@@ -0,0 +1,45 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+SERVER_MODE=asgi serves movierater.asgi through uvicorn workers, where the
+async views in api/async_views.py run up to ASYNC_DB_THREADS requests' database
+work at once per worker; the default is the WSGI application on sync workers.
+
+Each worker opens its database pool's minimum connections as it boots
+(movierater/db_pool.py).
+
+Workers write Prometheus metrics to PROMETHEUS_MULTIPROC_DIR so /metrics
+can add up all of them (see api/metrics.py).
+"""
+import os
+import shutil
+
+# must be set before any worker imports prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/movierater-metrics')
+
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'movierater.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'movierater.wsgi:application'
+
+
+def on_starting(server):
+    # files left by a previous master would be counted again
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    from movierater import db_pool
+    try:
+        db_pool.warm()
+    except Exception:
+        # the pool retries on first use; don't stop the worker from booting
+        worker.log.exception('Could not pre-warm the database pool')
@@ -1,48 +1,156 @@
 # Database router for schema management in shared Azure SQL Database
 
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 import environ
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
 
 # Initialize environment
 env = environ.Env()
 
+# True while the current request must read from the primary
+_pinned = ContextVar('movierater_read_pinned', default=False)
+
+# {replica alias: (checked at, usable)}
+_replica_state = {}
+_replica_lock = threading.Lock()
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin_user(user_id):
+    """
+    Send the user's reads to the primary for READ_YOUR_WRITES_SECONDS.
+
+    Call after a write, so the user sees it before the replicas catch up.
+    """
+    _pinned.set(True)
+    if settings.DATABASE_REPLICAS:
+        cache.set(_pin_key(user_id), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def begin_request():
+    """Reset pinning for a new request; returns a token for end_request()."""
+    return _pinned.set(False)
+
+
+def end_request(token):
+    _pinned.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def pin_request(user_id):
+    """Pin the current request if its user wrote recently."""
+    if settings.DATABASE_REPLICAS and cache.get(_pin_key(user_id)):
+        _pinned.set(True)
+
+
+async def apin_request(user_id):
+    if settings.DATABASE_REPLICAS and await cache.aget(_pin_key(user_id)):
+        _pinned.set(True)
+
+
+def replica_lag(alias):
+    """Replication lag of a replica in seconds (0 if it can't be measured)."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        # an idle primary sends no new transactions, so a replica that has
+        # replayed everything it received is not lagging
+        cursor.execute(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+            'THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - '
+            'pg_last_xact_replay_timestamp()), 0) END')
+        return float(cursor.fetchone()[0])
+
+
+def replica_usable(alias):
+    """Whether a replica is reachable and within REPLICA_MAX_LAG_SECONDS."""
+    now = time.monotonic()
+    state = _replica_state.get(alias)
+    if state and now - state[0] < settings.REPLICA_CHECK_INTERVAL:
+        return state[1]
+    with _replica_lock:
+        state = _replica_state.get(alias)
+        if state and now - state[0] < settings.REPLICA_CHECK_INTERVAL:
+            return state[1]
+        try:
+            usable = replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+        except Exception:
+            usable = False
+        _replica_state[alias] = (now, usable)
+        return usable
+
+
 class MovieRaterSchemaRouter:
     """
     A router to control database operations for MovieRater API models
     Ensures all MovieRater tables are created in the designated schema
+
+    Reads are spread over the DATABASE_REPLICAS, except inside a transaction
+    on the primary, for a user who wrote in the last few seconds (see
+    pin_user) and on replicas that lag behind or can't be reached.
     """
-    
+
     def __init__(self):
         self.schema_name = env('AZURE_SQL_SCHEMA', default='movie_rater_api')
         self.movie_rater_apps = {'api', 'home'}  # Your Django apps
-    
+
     def db_for_read(self, model, **hints):
         """Suggest the database to read from."""
-        if model._meta.app_label in self.movie_rater_apps:
+        if model._meta.app_label not in self.movie_rater_apps:
+            return None
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or _pinned.get()
+                or connections['default'].in_atomic_block):
             return 'default'
-        return None
-    
+        usable = [alias for alias in replicas if replica_usable(alias)]
+        return random.choice(usable) if usable else 'default'
+
     def db_for_write(self, model, **hints):
         """Suggest the database to write to."""
         if model._meta.app_label in self.movie_rater_apps:
             return 'default'
         return None
-    
+
     def allow_relation(self, obj1, obj2, **hints):
         """Allow relations if models are in the movie_rater apps."""
-        db_set = {'default'}
+        # replicas hold the same rows as the primary
+        db_set = {'default', *settings.DATABASE_REPLICAS}
         if obj1._state.db in db_set and obj2._state.db in db_set:
             return True
         return None
-    
+
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         """Ensure that certain apps' models get created on the right database."""
+        if db in settings.DATABASE_REPLICAS:
+            # replicas get their schema from the primary
+            return False
         if app_label in self.movie_rater_apps:
             return db == 'default'
         elif db == 'default':
             # Don't migrate non-MovieRater apps to our database
             return app_label in self.movie_rater_apps
         return None
-    
+
     def get_schema_name(self):
         """Get the schema name for MovieRater tables."""
-        return self.schema_name
\ No newline at end of file
+        return self.schema_name
@@ -0,0 +1,184 @@
+"""
+Database connection pooling helpers.
+
+PostgreSQL uses Django's native psycopg pool (OPTIONS['pool'] in settings).
+Azure SQL has no pool in mssql-django, so the movierater.mssql_pool backend
+keeps raw pyodbc connections in the ConnectionPool below. Both are bounded
+per process, so workers x max size is the most connections a deployment can
+open against the database's cap.
+
+warm() opens each pool's minimum connections; gunicorn calls it when a
+worker boots so the first requests don't pay for the connect. stats()
+reports the pool state for the metrics endpoint.
+"""
+import threading
+import time
+from collections import deque
+
+from django.db import connections
+from django.db.utils import OperationalError
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of DB-API connections.
+
+    At most max_size connections exist at once; acquire() waits up to
+    timeout seconds for one to come back before failing. Connections idle
+    for longer than max_idle seconds are closed, down to min_size, and a
+    connection idle for longer than check_after seconds is tested with
+    `SELECT 1` before it is handed out again.
+    """
+
+    def __init__(self, connect, min_size=2, max_size=10, timeout=30,
+                 max_idle=600, check_after=30):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.idle = deque()  # (connection, returned at), most recent last
+        self.size = 0
+        self.waiting = 0
+        self.opened = 0
+        self.checkouts = 0
+        self.lock = threading.Condition()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.lock:
+            while True:
+                self._prune()
+                if self.idle:
+                    connection, returned = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(
+                        f'No database connection available within {self.timeout}s '
+                        f'({self.max_size} in use)')
+                self.waiting += 1
+                try:
+                    self.lock.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.checkouts += 1
+
+        if connection is not None:
+            if time.monotonic() - returned < self.check_after or self._healthy(connection):
+                return connection
+            # broken: replace it, keeping its slot
+            self._close(connection)
+        return self._open()
+
+    def release(self, connection, discard=False):
+        if discard:
+            self._close(connection)
+            with self.lock:
+                self.size -= 1
+                self.lock.notify()
+            return
+        with self.lock:
+            self.idle.append((connection, time.monotonic()))
+            self.lock.notify()
+
+    def fill(self):
+        """Open connections until min_size exist."""
+        while True:
+            with self.lock:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            self.release(self._open())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max': self.max_size,
+                'size': self.size,
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                'opened': self.opened,
+                'checkouts': self.checkouts,
+            }
+
+    def _open(self):
+        # the slot is already counted in self.size
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.lock:
+                self.size -= 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.opened += 1
+        return connection
+
+    def _healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _prune(self):
+        # called with the lock held; the oldest idle connections are first
+        now = time.monotonic()
+        while (self.idle and self.size > self.min_size
+               and now - self.idle[0][1] > self.max_idle):
+            connection, _ = self.idle.popleft()
+            self.size -= 1
+            self._close(connection)
+
+
+def _pooled(connection):
+    if connection.vendor == 'postgresql':
+        return bool(connection.settings_dict['OPTIONS'].get('pool'))
+    return hasattr(connection, 'warm_pool')
+
+
+def warm():
+    """Open the minimum number of connections of every configured pool."""
+    for connection in connections.all():
+        if not _pooled(connection):
+            continue
+        if connection.vendor == 'postgresql':
+            connection.pool.open(wait=True)
+        else:
+            connection.warm_pool()
+
+
+def stats():
+    """{alias: pool stats} for every pooled database."""
+    result = {}
+    for connection in connections.all():
+        if not _pooled(connection):
+            continue
+        if connection.vendor == 'postgresql':
+            pool = connection.pool.get_stats()
+            result[connection.alias] = {
+                'max': pool.get('pool_max', 0),
+                'size': pool.get('pool_size', 0),
+                'idle': pool.get('pool_available', 0),
+                'waiting': pool.get('requests_waiting', 0),
+                'opened': pool.get('connections_num', 0),
+                'checkouts': pool.get('requests_num', 0),
+            }
+        else:
+            result[connection.alias] = connection.pool_stats()
+    return result
@@ -0,0 +1,53 @@
+"""
+mssql-django with a per-process pool of pyodbc connections.
+
+Use ENGINE 'movierater.mssql_pool' and size the pool with OPTIONS['pool']
+(min_size, max_size, timeout, max_idle, check_after; see
+movierater.db_pool.ConnectionPool). Django's close() at the end of each
+request hands the connection back to the pool instead of closing it, and
+connections that saw errors are dropped rather than reused.
+"""
+import threading
+
+from mssql import base
+
+from movierater.db_pool import ConnectionPool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._pools_lock:
+            if self.alias not in self._pools:
+                params = self.get_connection_params()
+                options = self.settings_dict['OPTIONS'].get('pool') or {}
+                self._pools[self.alias] = ConnectionPool(
+                    lambda: base.DatabaseWrapper.get_new_connection(self, params),
+                    **options)
+            return self._pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        discard = self.errors_occurred
+        if not discard and not self.autocommit:
+            # never hand out a connection in the middle of a transaction
+            try:
+                connection.rollback()
+                connection.autocommit = True
+            except Exception:
+                discard = True
+        self.pool.release(connection, discard=discard)
+
+    def warm_pool(self):
+        self.pool.fill()
+
+    def pool_stats(self):
+        return self.pool.stats()
@@ -76,6 +76,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestTimingMiddleware',
+    'api.middleware.ReadReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -115,16 +117,49 @@ LOGIN_REDIRECT_URL = '/admin/'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Connection pool size per worker process (PostgreSQL and Azure SQL).
+# workers x DB_POOL_MAX_SIZE must stay below the database's connection cap;
+# DB_POOL_MAX_SIZE=0 turns pooling off
+DB_POOL_MIN_SIZE = env.int('DB_POOL_MIN_SIZE', default=2)
+DB_POOL_MAX_SIZE = env.int('DB_POOL_MAX_SIZE', default=10)
+# seconds to wait for a free connection, and to keep an idle one open
+DB_POOL_TIMEOUT = env.int('DB_POOL_TIMEOUT', default=30)
+DB_POOL_MAX_IDLE = env.int('DB_POOL_MAX_IDLE', default=600)
+# threads per process that run the async views' database work
+# (api/async_views.py); more than the pool's max size would only queue
+ASYNC_DB_THREADS = env.int('ASYNC_DB_THREADS', default=DB_POOL_MAX_SIZE or 10)
+
 # Priority: PostgreSQL (Heroku) > Azure SQL > SQLite (development)
 if 'DATABASE_URL' in os.environ:
     # Use Heroku PostgreSQL (preferred for production)
-    DATABASES = {
-        'default': dj_database_url.config(
-            default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
-            conn_health_checks=True,
-        )
-    }
+    if DB_POOL_MAX_SIZE:
+        # Django's native psycopg 3 pool; connections go back to the pool
+        # after each request, so persistent connections are off. With health
+        # checks on, Django has the pool test connections before handing
+        # them out
+        DATABASES = {
+            'default': dj_database_url.config(
+                default=os.environ.get('DATABASE_URL'),
+                conn_max_age=0,
+                conn_health_checks=True,
+            )
+        }
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': DB_POOL_MAX_IDLE,
+        }
+    else:
+        DATABASES = {
+            'default': dj_database_url.config(
+                default=os.environ.get('DATABASE_URL'),
+                # persistent connections are per thread, and ASGI runs the
+                # ORM on short-lived threads, so only keep them under WSGI
+                conn_max_age=0 if env('SERVER_MODE', default='wsgi') == 'asgi' else 600,
+                conn_health_checks=True,
+            )
+        }
     print("Using Heroku PostgreSQL database")
 elif env("AZURE_SQL_HOST", default=None) and not DEBUG:
     # Azure SQL configuration (fallback)
@@ -140,7 +175,8 @@ elif env("AZURE_SQL_HOST", default=None) and not DEBUG:
     
     DATABASES = {
         'default': {
-            'ENGINE': 'mssql',
+            # mssql-django with a pyodbc connection pool
+            'ENGINE': 'movierater.mssql_pool' if DB_POOL_MAX_SIZE else 'mssql',
             'NAME': env('AZURE_SQL_NAME'),
             'USER': env('AZURE_SQL_USER'),
             'PASSWORD': env('AZURE_SQL_PASSWORD'),
@@ -153,6 +189,12 @@ elif env("AZURE_SQL_HOST", default=None) and not DEBUG:
                 'options': {
                     'isolation_level': 'read_committed',
                 },
+                'pool': {
+                    'min_size': DB_POOL_MIN_SIZE,
+                    'max_size': DB_POOL_MAX_SIZE,
+                    'timeout': DB_POOL_TIMEOUT,
+                    'max_idle': DB_POOL_MAX_IDLE,
+                },
             },
         }
     }
@@ -163,17 +205,153 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL lets readers run while a write is in progress; take the
+                # write lock when a transaction starts instead of failing
+                # with "database is locked" when it upgrades later
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=5000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA mmap_size=134217728'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+            },
         }
     }
     print("Using local sqlite3 for development")
 
+# Read replicas: comma separated database URLs. Reads are spread over them,
+# except for a user who wrote in the last READ_YOUR_WRITES_SECONDS, and a
+# replica more than REPLICA_MAX_LAG_SECONDS behind (checked every
+# REPLICA_CHECK_INTERVAL seconds) is skipped
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=0, conn_health_checks=True)
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}):
+        DATABASES[alias].setdefault('OPTIONS', {})['pool'] = \
+            dict(DATABASES['default']['OPTIONS']['pool'])
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+READ_YOUR_WRITES_SECONDS = env.int('READ_YOUR_WRITES_SECONDS', default=10)
+REPLICA_MAX_LAG_SECONDS = env.float('REPLICA_MAX_LAG_SECONDS', default=5)
+REPLICA_CHECK_INTERVAL = env.float('REPLICA_CHECK_INTERVAL', default=5)
+
 # Database routers for schema management in shared Azure SQL Database
 DATABASE_ROUTERS = ['movierater.database_router.MovieRaterSchemaRouter']
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # orjson for JSON, MessagePack for internal consumers that ask for it
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'api.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Cache used for API responses and their version keys. Every gunicorn worker
+# must see the same version keys, so production defaults to a file cache
+# shared by the workers of a dyno; set CACHE_URL=dbcache://<table> to share
+# it between dynos (run `python manage.py createcachetable` first)
+CACHES = {
+    'default': env.cache_url(
+        'CACHE_URL',
+        default='locmemcache://' if DEBUG else 'filecache:///tmp/movierater-cache',
+    ),
+}
+CACHES['default'].setdefault('OPTIONS', {}).setdefault('MAX_ENTRIES', 10000)
+
+# Lifetime in seconds of cached movie list/detail responses; writes
+# invalidate them straight away through version keys
+API_CACHE_TIMEOUT = env.int('API_CACHE_TIMEOUT', default=600)
+
+# Seconds a token -> user lookup stays cached by CachedTokenAuthentication;
+# deleting a token or saving its user drops the entry straight away
+AUTH_TOKEN_CACHE_TIMEOUT = env.int('AUTH_TOKEN_CACHE_TIMEOUT', default=300)
+
+# Prior for the Bayesian (damped) average behind /api/movies/top/: every
+# movie counts as RATING_PRIOR_WEIGHT extra votes of RATING_PRIOR_MEAN stars.
+# After changing either, run `python manage.py rank_movies`
+RATING_PRIOR_MEAN = env.float('RATING_PRIOR_MEAN', default=3.0)
+RATING_PRIOR_WEIGHT = env.int('RATING_PRIOR_WEIGHT', default=10)
+
+# Maximum number of movies returned by GET /api/movies/?q=
+SEARCH_MAX_RESULTS = env.int('SEARCH_MAX_RESULTS', default=50)
+
+# Maximum number of ids in GET /api/movies/?ids= and POST /api/movies/batch/
+MOVIE_BATCH_MAX_IDS = env.int('MOVIE_BATCH_MAX_IDS', default=500)
+
+# Maximum number of items accepted by POST /api/ratings/bulk/
+RATING_BULK_MAX_ITEMS = env.int('RATING_BULK_MAX_ITEMS', default=5000)
+
+# Poster uploads (POST /api/movies/upload_image/, see api.images): the largest
+# file accepted, the fixed thumbnail sizes (width, height) and JPEG/WebP
+# quality, and how many background threads per process make thumbnails
+IMAGE_UPLOAD_MAX_BYTES = env.int('IMAGE_UPLOAD_MAX_BYTES', default=5 * 1024 * 1024)
+THUMBNAIL_SIZES = {
+    'small': (160, 240),
+    'medium': (320, 480),
+}
+THUMBNAIL_QUALITY = env.int('THUMBNAIL_QUALITY', default=80)
+THUMBNAIL_WORKERS = env.int('THUMBNAIL_WORKERS', default=2)
+
+# S3-compatible object storage for posters (see api.storage); leave the
+# bucket unset to keep them on local disk. AWS_S3_ENDPOINT_URL points at
+# MinIO or another S3 stand-in. Credentials come from AWS_ACCESS_KEY_ID and
+# AWS_SECRET_ACCESS_KEY (or any other source boto3 looks at).
+AWS_STORAGE_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME', default='')
+AWS_S3_REGION_NAME = env('AWS_S3_REGION_NAME', default='eu-west-1')
+AWS_S3_ENDPOINT_URL = env('AWS_S3_ENDPOINT_URL', default='') or None
+AWS_DEFAULT_ACL = env('AWS_DEFAULT_ACL', default='public-read') or None
+# Presigned upload URLs last AWS_PRESIGNED_EXPIRY seconds and are reused
+# for the same image until AWS_PRESIGNED_MIN_TTL seconds before they expire
+AWS_PRESIGNED_EXPIRY = env.int('AWS_PRESIGNED_EXPIRY', default=3600)
+AWS_PRESIGNED_MIN_TTL = env.int('AWS_PRESIGNED_MIN_TTL', default=300)
+# Files above the threshold are uploaded in parts of this size (S3 needs at
+# least 5 MB per part)
+AWS_MULTIPART_THRESHOLD = env.int('AWS_MULTIPART_THRESHOLD', default=8 * 1024 * 1024)
+AWS_MULTIPART_CHUNKSIZE = env.int('AWS_MULTIPART_CHUNKSIZE', default=8 * 1024 * 1024)
+
+# Requests slower than this many milliseconds are logged as warnings with a
+# sample of their slowest SQL statements
+SLOW_REQUEST_THRESHOLD_MS = env.int('SLOW_REQUEST_THRESHOLD_MS', default=500)
+
+# Bearer token Prometheus must send to scrape /metrics. Without one the
+# endpoint is only served when DEBUG is on
+METRICS_AUTH_TOKEN = env('METRICS_AUTH_TOKEN', default='')
+
+# Log to the console (Heroku collects stdout). api.timing writes one JSON
+# line per request at INFO; set TIMING_LOG_LEVEL=WARNING to keep only the
+# slow ones
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': env('TIMING_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
 }
 
 # django-cors-headers >= 4 uses CORS_ALLOWED_ORIGINS (list)
@@ -0,0 +1,34 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=movierater.settings_test
+"""
+import tempfile
+
+from .database_router import MovieRaterSchemaRouter
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASE_REPLICAS, LOGGING
+
+
+class TestSchemaRouter(MovieRaterSchemaRouter):
+    """
+    The schema router, except that the test database gets every app.
+
+    In production Django's own apps live outside the shared database; the
+    throwaway test database needs their tables too.
+    """
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in DATABASE_REPLICAS:
+            return False
+        return db == 'default'
+
+
+DATABASE_ROUTERS = [TestSchemaRouter()]
+
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='movierater-test-media-')
+AWS_STORAGE_BUCKET_NAME = ''
+
+LOGGING['loggers']['api.timing']['level'] = 'WARNING'
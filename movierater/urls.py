@@ -20,6 +20,7 @@ from django.conf.urls import include
 from rest_framework.authtoken.views import obtain_auth_token
 from movierater import settings
 from django.views.generic.base import RedirectView
+from api.metrics import metrics_view
 
 favicon_view = RedirectView.as_view(url='favicon/favicon.ico', permanent=True)
 
@@ -34,6 +35,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('auth/', obtain_auth_token),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: